@@ -1,3 +1,8 @@
+import asyncio
+import logging
+import logging.handlers
+import queue
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
@@ -6,43 +11,83 @@ from contextlib import asynccontextmanager
 from metadata_store import MetadataStore
 from embedding_manager import EmbeddingManager
 from sync_orchestrator import SchemaSyncOrchestrator
-from config import METADATA_DB_CONFIG, MILVUS_CONFIG
+from config import get_settings, get_milvus_config
+
+log = logging.getLogger("sync")
 
 # Global variables for component instances
 metadata_store = None
 embedding_manager = None
 orchestrator = None
 
+# Max number of connections /sync processes at the same time
+SYNC_CONCURRENCY = 8
+_sync_semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+
+def _start_log_listener():
+    """
+    Route root logging through a queue so request threads never block on
+    log I/O; a background listener thread writes the records to stderr.
+    """
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener, queue_handler
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize components on startup and cleanup on shutdown."""
     global metadata_store, embedding_manager, orchestrator
     
-    print("Initializing components...")
+    log_listener, log_handler = _start_log_listener()
+    
+    log.info("Initializing components...")
+    settings = get_settings()
+    milvus_config = get_milvus_config()
     from pymilvus import utility, connections
+    milvus_alias = milvus_config.get('alias', 'default')
     try:
-        connections.connect(
-            alias=MILVUS_CONFIG.get('alias', 'default'),
-            uri=MILVUS_CONFIG.get('uri', './milvus_data.db')
-        )
+        if not connections.has_connection(milvus_alias):
+            connections.connect(**milvus_config)
         
         collection_name = "table_embeddings"
         if utility.has_collection(collection_name):
-            print(f"Dropping potentially corrupted collection: {collection_name}")
+            log.info("Dropping potentially corrupted collection: %s", collection_name)
             utility.drop_collection(collection_name)
-            print("Collection dropped successfully")
+            log.info("Collection dropped successfully")
     except Exception as e:
-        print(f"Warning: Could not drop collection: {e}")
-    metadata_store = MetadataStore(METADATA_DB_CONFIG)
-    embedding_manager = EmbeddingManager(MILVUS_CONFIG)
+        log.warning("Could not drop collection: %s", e)
+    metadata_store = MetadataStore(settings.metadata_db_dict(), settings.metadata_pool_dict())
+    embedding_manager = EmbeddingManager(
+        milvus_config,
+        cache_path=settings.embedding_cache_path,
+        cache_max_rows=settings.embedding_cache_max_rows,
+    )
     orchestrator = SchemaSyncOrchestrator(metadata_store, embedding_manager)
-    print("Components initialized successfully")
+    log.info("Components initialized successfully")
     
     yield
     
-    # Cleanup (if needed)
-    print("Shutting down...")
+    # Cleanup
+    log.info("Shutting down...")
+    metadata_store.close()
+    # Release the Milvus gRPC channel so reloads don't leak it
+    connections.disconnect(milvus_alias)
+    
+    # Drain queued records before the process exits
+    log_listener.stop()
+    logging.getLogger().removeHandler(log_handler)
 
 
 app = FastAPI(
@@ -120,6 +165,43 @@ class SyncResponse(BaseModel):
     results: List[SyncResult]
 
 
+def _blocking_sync_one(connection_dict, register=True):
+    """
+    Register (optionally) and sync one connection. Runs in a worker thread.
+    Raises on failure; callers turn the error into a SyncResult.
+    """
+    connection_id = connection_dict['connection_id']
+    connection_name = connection_dict['name']
+
+    log.info("Processing connection: %s (%s)", connection_id, connection_name)
+
+    # Step 1: Register connection
+    if register:
+        log.info("  - Registering connection %s in metadata store...", connection_id)
+        metadata_store.register_connection(connection_dict)
+
+    # Step 2: Sync connection
+    log.info("  - Syncing schema of %s to Milvus...", connection_id)
+    sync_result = orchestrator.sync_connection(connection_dict)
+
+    log.info("  ✓ Success (%s): %d tables synced, %d skipped",
+             connection_id, sync_result['synced'], sync_result['skipped'])
+
+    return SyncResult(
+        connection_id=connection_id,
+        name=connection_name,
+        success=True,
+        synced=sync_result.get('synced', 0),
+        skipped=sync_result.get('skipped', 0)
+    )
+
+
+async def _sync_one(connection_dict, register=True):
+    """Run _blocking_sync_one off the event loop, bounded by SYNC_CONCURRENCY."""
+    async with _sync_semaphore:
+        return await asyncio.to_thread(_blocking_sync_one, connection_dict, register)
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -183,43 +265,36 @@ async def sync_connections(request: SyncRequest):
     successful_count = 0
     failed_count = 0
     
-    for connection_config in request.connections:
-        connection_dict = connection_config.model_dump()
-        connection_id = connection_dict['connection_id']
-        connection_name = connection_dict['name']
+    # Dump each model exactly once; the store and orchestrator take dicts
+    connection_dicts = [c.model_dump() for c in request.connections]
+    
+    try:
+        # Step 1: Register every connection in one round-trip
+        log.info("Registering %d connection(s) in metadata store...", len(connection_dicts))
+        await asyncio.to_thread(metadata_store.register_connections_bulk, connection_dicts)
         
-        try:
-            print(f"\nProcessing connection: {connection_id} ({connection_name})")
-            
-            # Step 1: Register connection
-            print(f"  - Registering connection in metadata store...")
-            metadata_store.register_connection(connection_dict)
-            
-            # Step 2: Sync connection
-            print(f"  - Syncing schema to Milvus...")
-            sync_result = orchestrator.sync_connection(connection_dict)
-            
-            # Create success result
-            result = SyncResult(
-                connection_id=connection_id,
-                name=connection_name,
-                success=True,
-                synced=sync_result.get('synced', 0),
-                skipped=sync_result.get('skipped', 0)
-            )
-            
-            successful_count += 1
-            print(f"  ✓ Success: {sync_result['synced']} tables synced, {sync_result['skipped']} skipped")
-            
-        except Exception as e:
-            print(f"  ✗ Error: {str(e)}")
+        # Step 2: Sync all connections concurrently, each in a worker thread
+        outcomes = await asyncio.gather(
+            *[_sync_one(connection_dict, register=False) for connection_dict in connection_dicts],
+            return_exceptions=True
+        )
+    except Exception as e:
+        # Registration failed, so none of the connections can be synced
+        outcomes = [e] * len(connection_dicts)
+    
+    for connection_config, outcome in zip(request.connections, outcomes):
+        if isinstance(outcome, Exception):
+            log.error("  ✗ Error (%s): %s", connection_config.connection_id, outcome)
             result = SyncResult(
-                connection_id=connection_id,
-                name=connection_name,
+                connection_id=connection_config.connection_id,
+                name=connection_config.name,
                 success=False,
-                error=str(e)
+                error=str(outcome)
             )
             failed_count += 1
+        else:
+            result = outcome
+            successful_count += 1
         
         results.append(result)
     
@@ -251,32 +326,12 @@ async def sync_single_connection(connection: ConnectionConfig):
         )
     
     connection_dict = connection.model_dump()
-    connection_id = connection_dict['connection_id']
-    connection_name = connection_dict['name']
     
     try:
-        print(f"\nProcessing connection: {connection_id} ({connection_name})")
-        
-        # Step 1: Register connection
-        print(f"  - Registering connection in metadata store...")
-        metadata_store.register_connection(connection_dict)
-        
-        # Step 2: Sync connection
-        print(f"  - Syncing schema to Milvus...")
-        sync_result = orchestrator.sync_connection(connection_dict)
-        
-        print(f"  ✓ Success: {sync_result['synced']} tables synced, {sync_result['skipped']} skipped")
-        
-        return SyncResult(
-            connection_id=connection_id,
-            name=connection_name,
-            success=True,
-            synced=sync_result.get('synced', 0),
-            skipped=sync_result.get('skipped', 0)
-        )
+        return await _sync_one(connection_dict)
         
     except Exception as e:
-        print(f"  ✗ Error: {str(e)}")
+        log.error("  ✗ Error (%s): %s", connection.connection_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to sync connection: {str(e)}"
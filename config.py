@@ -1,59 +1,121 @@
-import os
-from dotenv import load_dotenv
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
 
-# Load environment variables
-load_dotenv()
-
-# PostgreSQL metadata store configuration
-METADATA_DB_CONFIG = {
-    "host": os.getenv("METADATA_DB_HOST", "localhost"),
-    "port": int(os.getenv("METADATA_DB_PORT", 5432)),
-    "database": os.getenv("METADATA_DB_NAME", "metadata_store"),
-    "user": os.getenv("METADATA_DB_USER", "postgres"),
-    "password": os.getenv("METADATA_DB_PASSWORD", "password")
-}
-
-# Milvus configuration
-# Supports both self-hosted and Zilliz Cloud
-if os.getenv("MILVUS_URI"):
-    # Milvus Lite mode (embedded, file-based)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    MILVUS_CONFIG = {
-        "uri": os.getenv("MILVUS_URI", f"./milvus_data_{timestamp}.db"),
-        "alias": "default"
-    }
-elif os.getenv("MILVUS_HOST"):
-    # Standalone Milvus mode (separate service)
-    MILVUS_CONFIG = {
-        "host": os.getenv("MILVUS_HOST", "localhost"),
-        "port": int(os.getenv("MILVUS_PORT", "19530")),
-        "alias": "default"
-    }
-else:
-    # Default to Milvus Lite for development
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    MILVUS_CONFIG = {
-        "uri": os.getenv("MILVUS_URI", f"./milvus_data_{timestamp}.db"),
-        "alias": "default"
-    }
-
-# Add Zilliz Cloud authentication if API key is provided
-if os.getenv("MILVUS_API_KEY"):
-    MILVUS_CONFIG["token"] = os.getenv("MILVUS_API_KEY")
-    MILVUS_CONFIG["secure"] = True
-
-# Example MySQL connection configuration
-# In production, this will be provided by the client via API
-MYSQL_CONNECTION = {
-    "connection_id": "mysql_test_001",
-    "name": "Test MySQL Database",
-    "type": "mysql",
-    "host": os.getenv("MYSQL_HOST", "localhost"),
-    "port": int(os.getenv("MYSQL_PORT", 3306)),
-    "database": os.getenv("MYSQL_DATABASE", "test_db"),
-    "username": os.getenv("MYSQL_USER", "root"),
-    "password": os.getenv("MYSQL_PASSWORD", "password")
-}
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class Settings(BaseSettings):
+    """
+    Application settings.
+    Read once from environment variables / .env (see get_settings()).
+    Field names map to the upper-case variables, e.g. METADATA_DB_HOST.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
+
+    # PostgreSQL metadata store configuration
+    metadata_db_host: str = "localhost"
+    metadata_db_port: int = 5432
+    metadata_db_name: str = "metadata_store"
+    metadata_db_user: str = "postgres"
+    metadata_db_password: str = "password"
+
+    # Connection pool sizing for the metadata store
+    metadata_pool_min: int = 5
+    metadata_pool_max: int = 20
+
+    # Milvus configuration
+    # Supports Milvus Lite (MILVUS_URI), standalone (MILVUS_HOST) and Zilliz Cloud
+    milvus_uri: Optional[str] = None
+    milvus_host: Optional[str] = None
+    milvus_port: int = 19530
+    milvus_api_key: Optional[str] = None
+
+    # SQLite file caching embeddings by schema hash (disabled when unset)
+    embedding_cache_path: Optional[str] = None
+    embedding_cache_max_rows: int = 200_000
+
+    # Query score model backend ('torch' or 'onnx')
+    query_score_backend: str = "torch"
+
+    # Example MySQL connection configuration
+    # In production, this will be provided by the client via API
+    mysql_host: str = "localhost"
+    mysql_port: int = 3306
+    mysql_database: str = "test_db"
+    mysql_user: str = "root"
+    mysql_password: str = "password"
+
+    def metadata_db_dict(self):
+        """psycopg2 connect() kwargs for the metadata store."""
+        return {
+            "host": self.metadata_db_host,
+            "port": self.metadata_db_port,
+            "database": self.metadata_db_name,
+            "user": self.metadata_db_user,
+            "password": self.metadata_db_password
+        }
+
+    def metadata_pool_dict(self):
+        """Pool sizing for MetadataStore."""
+        return {
+            "minconn": self.metadata_pool_min,
+            "maxconn": self.metadata_pool_max
+        }
+
+    def mysql_connection(self):
+        """Connection info for the example MySQL database."""
+        return {
+            "connection_id": "mysql_test_001",
+            "name": "Test MySQL Database",
+            "type": "mysql",
+            "host": self.mysql_host,
+            "port": self.mysql_port,
+            "database": self.mysql_database,
+            "username": self.mysql_user,
+            "password": self.mysql_password
+        }
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Settings singleton, built on first call."""
+    return Settings()
+
+
+@lru_cache
+def get_milvus_config():
+    """
+    Milvus connection kwargs, built once per process.
+    Treat the returned dict as read-only.
+    """
+    settings = get_settings()
+
+    if settings.milvus_uri:
+        # Milvus Lite mode (embedded, file-based)
+        milvus_config = {
+            "uri": settings.milvus_uri,
+            "alias": "default"
+        }
+    elif settings.milvus_host:
+        # Standalone Milvus mode (separate service)
+        milvus_config = {
+            "host": settings.milvus_host,
+            "port": settings.milvus_port,
+            "alias": "default"
+        }
+    else:
+        # Default to Milvus Lite for development
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        milvus_config = {
+            "uri": f"./milvus_data_{timestamp}.db",
+            "alias": "default"
+        }
+
+    # Add Zilliz Cloud authentication if API key is provided
+    if settings.milvus_api_key:
+        milvus_config["token"] = settings.milvus_api_key
+        milvus_config["secure"] = True
+
+    return milvus_config
@@ -1,6 +1,29 @@
 from sentence_transformers import SentenceTransformer
+import torch
+from collections import OrderedDict
+import threading
 from pymilvus import Collection, connections, utility, FieldSchema, CollectionSchema, DataType
+from pymilvus.client.types import LoadState
+import hashlib
+import logging
 import json
+import orjson
+import sqlite3
+import time
+import numpy as np
+
+# Max rendered descriptions kept by build_table_description
+DESCRIPTION_CACHE_SIZE = 10_000
+
+# Rows per lookup in the on-disk embedding cache (under SQLite's bound-variable limit)
+EMBEDDING_CACHE_CHUNK = 500
+
+# Default row cap for the on-disk embedding cache (least recently used go first)
+EMBEDDING_CACHE_MAX_ROWS = 200_000
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+logger = logging.getLogger(__name__)
 
 
 class EmbeddingManager:
@@ -9,33 +32,76 @@ class EmbeddingManager:
     Checks if embeddings exist before generating.
     """
 
-    def __init__(self, milvus_config):
-        if 'uri' in milvus_config:
+    def __init__(self, milvus_config, quantize=True, cache_path=None,
+                 cache_max_rows=EMBEDDING_CACHE_MAX_ROWS):
+        alias = milvus_config.get('alias', 'default')
+        if connections.has_connection(alias):
+            # Reuse the existing gRPC channel (e.g. opened by the API lifespan)
+            logger.info("Reusing Milvus connection: %s", alias)
+        elif 'uri' in milvus_config:
             # Milvus Lite mode (embedded, file-based)
-            print(f"Connecting to Milvus Lite: {milvus_config['uri']}")
+            logger.info("Connecting to Milvus Lite: %s", milvus_config['uri'])
             connections.connect(
-                alias=milvus_config.get('alias', 'default'),
+                alias=alias,
                 uri=milvus_config['uri']
             )
         else:
             # Standalone Milvus mode (separate service)
-            print(f"Connecting to Milvus: {milvus_config['host']}:{milvus_config['port']}")
+            logger.info("Connecting to Milvus: %s:%s", milvus_config['host'], milvus_config['port'])
             connections.connect(**milvus_config)
         self.collection_name = "table_embeddings"
         self._ensure_collection_exists()
         self.collection = Collection(self.collection_name)
-        self.collection.load()
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        if utility.load_state(self.collection_name) != LoadState.Loaded:
+            self.collection.load()
+        # (connection_id, table_name, schema_hash) -> description, LRU order
+        self._description_cache = OrderedDict()
+        self._description_lock = threading.Lock()
+        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        quantized = quantize and self.model.device.type == "cpu"
+        if quantized:
+            # int8 Linear layers (the bulk of MiniLM's compute); outputs stay float32
+            torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        # Cached vectors are only valid for the model/precision that produced them
+        self.model_tag = f"{EMBEDDING_MODEL}:{'int8' if quantized else 'fp32'}"
+
+        # Optional on-disk cache: (model_tag, schema_hash) -> (description, float32 embedding)
+        self._embedding_cache = None
+        self._embedding_cache_lock = threading.Lock()
+        self._cache_max_rows = cache_max_rows
+        if cache_path:
+            self._embedding_cache = sqlite3.connect(cache_path, check_same_thread=False)
+            self._embedding_cache.execute("PRAGMA journal_mode=WAL")
+            # Pre-tag cache rows don't record which model produced them
+            self._embedding_cache.execute("DROP TABLE IF EXISTS embedding_cache")
+            self._embedding_cache.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model_tag TEXT NOT NULL,
+                    schema_hash TEXT NOT NULL,
+                    schema_text TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model_tag, schema_hash)
+                )
+            """)
+            self._embedding_cache.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            self._embedding_cache.commit()
 
     def _ensure_collection_exists(self):
         """Create collection if it doesn't exist."""
         if utility.has_collection(self.collection_name):
-            print('table exists')
+            logger.info("Using existing collection: %s", self.collection_name)
+            self._check_primary_key()
             return
 
         # Define schema with 3 columns: text (schema info), vectors, metadata
         fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            # Deterministic key (see embedding_id) so upsert replaces in place
+            FieldSchema(name="id", dtype=DataType.VARCHAR, max_length=64, is_primary=True, auto_id=False),
             FieldSchema(name="connection_id", dtype=DataType.VARCHAR, max_length=255),
             FieldSchema(name="table_name", dtype=DataType.VARCHAR, max_length=255),
             FieldSchema(name="schema_hash", dtype=DataType.VARCHAR, max_length=32),
@@ -44,60 +110,197 @@ class EmbeddingManager:
             FieldSchema(name="embedding_json", dtype=DataType.VARCHAR, max_length=65535),  # For retrieval
             FieldSchema(name="metadata", dtype=DataType.VARCHAR, max_length=65535)  # Metadata (JSON)
         ]
-        print('table not exist')
+        logger.info("Creating collection: %s", self.collection_name)
         schema = CollectionSchema(fields, description="Table schema embeddings", enable_dynamic_field=True)
         collection = Collection(self.collection_name, schema)
 
-        # Create index for vector search
+        # Create index for vector search (graph index, no IVF list probing)
         index_params = {
-            "index_type": "IVF_FLAT",
+            "index_type": "HNSW",
             "metric_type": "COSINE",
-            "params": {"nlist": 128}
+            "params": {"M": 16, "efConstruction": 200}
         }
         collection.create_index("embedding", index_params)
 
-    def embedding_exists(self, connection_id, table_name, schema_hash):
+    def _check_primary_key(self):
         """
-        Check if embedding exists and is up-to-date.
+        Fail early on collections created before the VARCHAR embedding_id key;
+        upserts into their auto-generated INT64 key would fail on every sync.
         """
-        # Query Milvus
-        expr = f'connection_id == "{connection_id}" and table_name == "{table_name}"'
-        print('e1')
-        self.collection.flush()
-        print('e2')
-        results = self.collection.query(
-            expr=expr,
-            output_fields=["schema_hash", "embedding_json"]
-        )
-        print('e3')
+        primary = Collection(self.collection_name).schema.primary_field
+        if primary.dtype != DataType.VARCHAR or primary.auto_id:
+            raise RuntimeError(
+                f"Milvus collection '{self.collection_name}' has an outdated primary key "
+                f"({primary.name}: {primary.dtype.name}, auto_id={primary.auto_id}). "
+                f"Drop it (utility.drop_collection) and clear table_metadata so the next "
+                f"sync re-embeds every table."
+            )
 
-        if not results:
-            return False, None
+    def up_to_date_tables(self, connection_id, table_names, schema_hashes, chunk_size=1000):
+        """
+        Return the subset of table_names whose stored embedding matches the
+        given schema hash. One `in` query per chunk, like existing_tables.
+        """
+        expected = dict(zip(table_names, schema_hashes))
+        names = list(expected)
+        fresh = set()
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            # json.dumps quotes/escapes the values the way Milvus expressions expect
+            expr = (
+                f'connection_id == {json.dumps(connection_id, ensure_ascii=False)}'
+                f' and table_name in {json.dumps(chunk, ensure_ascii=False)}'
+            )
+            results = self.collection.query(
+                expr=expr,
+                output_fields=["table_name", "schema_hash"]
+            )
+            fresh.update(
+                row["table_name"] for row in results
+                if row["schema_hash"] == expected[row["table_name"]]
+            )
+        return fresh
 
-        # Check if schema hash matches (schema unchanged)
-        existing_hash = results[0]["schema_hash"]
-        if existing_hash == schema_hash:
-            embedding = json.loads(results[0]["embedding_json"])
-            return True, embedding
-        else:
-            # Schema changed, need to regenerate
-            return False, None
+    def existing_tables(self, connection_id, table_names, chunk_size=1000):
+        """
+        Return the subset of table_names that have an embedding stored.
+        Uses one `in` query per chunk to stay under Milvus expr length limits.
+        """
+        table_names = list(table_names)
+        present = set()
+        for start in range(0, len(table_names), chunk_size):
+            chunk = table_names[start:start + chunk_size]
+            # json.dumps quotes/escapes the names the way Milvus expressions expect
+            expr = (
+                f'connection_id == {json.dumps(connection_id, ensure_ascii=False)}'
+                f' and table_name in {json.dumps(chunk, ensure_ascii=False)}'
+            )
+            results = self.collection.query(expr=expr, output_fields=["table_name"])
+            present.update(row["table_name"] for row in results)
+        return present
 
     def generate_embedding(self, schema):
         """
         Generate embedding for a table schema.
         """
-        # Build text description
-        description = self.build_table_description(schema)
+        return self.generate_embeddings_bulk([schema])[0].tolist()
 
-        # Generate embedding
-        embedding = self.model.encode(description)
+    def generate_embeddings_bulk(self, schemas):
+        """
+        Generate embeddings for many table schemas in one encode call.
+        Returns an N x 384 numpy array, one row per schema.
+        """
+        descriptions = [self.build_table_description(schema) for schema in schemas]
+
+        # One padded batch instead of N single-row forward passes
+        return self.model.encode(
+            descriptions,
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
 
-        return embedding.tolist()
+    def generate_embeddings_cached(self, schemas):
+        """
+        Like generate_embeddings_bulk, but reuses embeddings (and descriptions)
+        already computed for the same schema_hash, e.g. after a database is
+        restored from a backup. Only cache misses go through the model.
+
+        Returns:
+            (N x 384 float32 array, list of N descriptions)
+        """
+        hashes = [schema["schema_hash"] for schema in schemas]
+        cached = self._cache_get_many(hashes)
+
+        misses = [schema for schema in schemas if schema["schema_hash"] not in cached]
+        if misses:
+            new_rows = []
+            for schema, embedding in zip(misses, self.generate_embeddings_bulk(misses)):
+                entry = (self.build_table_description(schema), embedding.astype(np.float32))
+                cached[schema["schema_hash"]] = entry
+                new_rows.append((schema["schema_hash"], *entry))
+            self._cache_put_many(new_rows)
+
+        texts = [cached[h][0] for h in hashes]
+        embeddings = np.stack([cached[h][1] for h in hashes]) if hashes else np.empty((0, 384), np.float32)
+        return embeddings, texts
+
+    def _cache_get_many(self, schema_hashes):
+        """{schema_hash: (description, embedding)} for hashes in the disk cache."""
+        if self._embedding_cache is None:
+            return {}
+        found = {}
+        unique = list(dict.fromkeys(schema_hashes))
+        now = time.time()
+        with self._embedding_cache_lock, self._embedding_cache:
+            for start in range(0, len(unique), EMBEDDING_CACHE_CHUNK):
+                chunk = unique[start:start + EMBEDDING_CACHE_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._embedding_cache.execute(
+                    f"SELECT schema_hash, schema_text, embedding FROM embeddings"
+                    f" WHERE model_tag = ? AND schema_hash IN ({placeholders})",
+                    [self.model_tag, *chunk]
+                ).fetchall()
+                for schema_hash, schema_text, blob in rows:
+                    found[schema_hash] = (schema_text, np.frombuffer(blob, dtype=np.float32))
+                # Touch hits so eviction drops the least recently used rows
+                self._embedding_cache.execute(
+                    f"UPDATE embeddings SET last_used = ?"
+                    f" WHERE model_tag = ? AND schema_hash IN ({placeholders})",
+                    [now, self.model_tag, *chunk]
+                )
+        return found
+
+    def _cache_put_many(self, rows):
+        """
+        Store (schema_hash, description, embedding) rows in the disk cache,
+        then trim it to cache_max_rows by evicting the least recently used.
+        """
+        if self._embedding_cache is None or not rows:
+            return
+        now = time.time()
+        with self._embedding_cache_lock, self._embedding_cache:
+            self._embedding_cache.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                [(self.model_tag, h, text, embedding.tobytes(), now) for h, text, embedding in rows]
+            )
+            if self._cache_max_rows:
+                self._embedding_cache.execute("""
+                    DELETE FROM embeddings WHERE rowid IN (
+                        SELECT rowid FROM embeddings ORDER BY last_used
+                        LIMIT MAX(0, (SELECT COUNT(*) FROM embeddings) - ?)
+                    )
+                """, (self._cache_max_rows,))
 
     def build_table_description(self, schema):
         """
         Build text description for embedding.
+        Memoized by schema hash, so re-syncs of an unchanged schema and the
+        second lookup during the same sync skip the string building.
+        """
+        schema_hash = schema.get("schema_hash")
+        if schema_hash is None:
+            return self._render_table_description(schema)
+
+        key = (schema.get("connection_id"), schema["table_name"], schema_hash)
+        with self._description_lock:
+            desc = self._description_cache.get(key)
+            if desc is not None:
+                self._description_cache.move_to_end(key)
+                return desc
+
+        desc = self._render_table_description(schema)
+
+        with self._description_lock:
+            self._description_cache[key] = desc
+            if len(self._description_cache) > DESCRIPTION_CACHE_SIZE:
+                self._description_cache.popitem(last=False)
+        return desc
+
+    def _render_table_description(self, schema):
+        """
+        Format the description text (uncached).
         """
         desc = f"Table: {schema['table_name']}\n"
 
@@ -127,37 +330,69 @@ class EmbeddingManager:
 
         return desc
 
-    def store_embedding(self, connection_id, table_name, schema_hash, embedding, schema_text, metadata):
+    @staticmethod
+    def embedding_metadata(schema):
         """
-        Store or update embedding in Milvus.
+        Metadata stored next to a table's embedding.
         """
-        # Check if exists
-        expr = f'connection_id == "{connection_id}" and table_name == "{table_name}"'
-        self.collection.flush()
-        existing = self.collection.query(expr=expr, output_fields=["id"])
+        return {
+            "connection_id": schema["connection_id"],
+            "table_name": schema["table_name"],
+            "db_type": schema["db_type"],
+            "column_count": len(schema.get("columns", [])),
+            "has_foreign_keys": len(schema.get("foreign_keys", [])) > 0,
+            "estimated_rows": schema.get("estimated_rows")
+        }
 
-        if existing:
-            # Delete old embedding
-            ids = [item["id"] for item in existing]
-            self.collection.delete(f"id in {ids}")
+    @staticmethod
+    def embedding_id(connection_id, table_name):
+        """
+        Primary key for a table's embedding row.
+        """
+        return hashlib.sha1(f"{connection_id}|{table_name}".encode()).hexdigest()
 
-        # Insert new embedding with 3 main data points: schema_text, embedding (vectors), metadata
-        data = [{
+    def store_embedding(self, connection_id, table_name, schema_hash, embedding, schema_text, metadata):
+        """
+        Store or update embedding in Milvus.
+        Call flush() once the whole batch has been stored.
+        """
+        self.store_embeddings_bulk([{
             "connection_id": connection_id,
             "table_name": table_name,
             "schema_hash": schema_hash,
-            "schema_text": schema_text,  # Text (schema info)
-            "embedding": embedding,  # Vectors
-            "embedding_json": json.dumps(embedding),
-            "metadata": json.dumps(metadata)  # Metadata (JSON string)
-        }]
+            "schema_text": schema_text,
+            "embedding": embedding,
+            "metadata": metadata
+        }])
 
-       
-        print("Schema fields:", [f.name for f in self.collection.schema.fields])
-        print("Data structure lens:", [len(col) for col in data])
-
-        self.collection.insert(data)
+    def store_embeddings_bulk(self, rows, batch_size=1000):
+        """
+        Store or update many embeddings with column-format upserts.
+        Each row is a dict with the store_embedding arguments as keys;
+        embedding may be a list or a float32 numpy row.
+        Call flush() once the whole batch has been stored.
+        """
+        # Chunked only to keep each gRPC message well under Milvus' size limit
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+
+            # One list per field, in collection schema order:
+            # schema_text (text), embedding (vectors), metadata (JSON string)
+            self.collection.upsert([
+                [self.embedding_id(r["connection_id"], r["table_name"]) for r in chunk],
+                [r["connection_id"] for r in chunk],
+                [r["table_name"] for r in chunk],
+                [r["schema_hash"] for r in chunk],
+                [r["schema_text"] for r in chunk],
+                [r["embedding"] for r in chunk],
+                [orjson.dumps(r["embedding"], option=orjson.OPT_SERIALIZE_NUMPY).decode() for r in chunk],
+                [orjson.dumps(r["metadata"], default=str).decode() for r in chunk]
+            ])
 
+    def flush(self):
+        """
+        Seal pending upserts. One call per connection sync.
+        """
         self.collection.flush()
 
 
@@ -1,34 +1,88 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 from schema_inspector import UniversalSchemaInspector
-from inference_api import QueryScorePredictor
+from inference_api import get_predictor
+
+# Simple stop words list for keyword extraction
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'been',
+    'be', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'should', 'could', 'may', 'might', 'must', 'can', 'get', 'show', 'list'
+})
+
+_WORD_RE = re.compile(r'\w+')
+
+# Heuristic lookup tables
+# Simplicity by complexity: 1 table, direct pair, chain (anything else scores as a chain)
+_SIMPLICITY = np.array([0.6, 1.0, 0.8, 0.6])
+# Join quality by number of joins: none, one direct join, multiple (chain)
+_JOIN_QUALITY = np.array([1.0, 0.9, 0.7])
+
+def _column_sets(schema):
+    """Lowercase column names of a table schema, and their '_'-separated tokens."""
+    col_names = [col["name"].lower() for col in schema.get("columns", [])]
+    tokens = frozenset(tok for name in col_names for tok in name.split("_"))
+    return frozenset(col_names), tokens
+
 
 class GraphRanker:
     def __init__(self, question, connections):
         self.question = question
         self.connections = connections
+        self._kw_cache = {}  # question -> keywords
         self.schema_metadata = self.get_schema_metadata()
-        self.predictor = QueryScorePredictor(
-        model_path='model/final_model.pt',
-        tokenizer_path='model/'
-    )
+        # Shared across requests; loaded once per process
+        self.predictor = get_predictor()
 
     def get_schema_metadata(self):
-        
+        """
+        Fetch table schemas for all connections in parallel.
+        Connections are inspected concurrently, and each one fetches its
+        tables concurrently too (the DB round-trips are the bottleneck).
+        """
         schema_metadata = {}
-        for conn in self.connections:
-            inspector = UniversalSchemaInspector(conn)
-            inspector.connect()
+        if not self.connections:
+            return schema_metadata
 
-            # Get all tables
-            tables = inspector.get_all_tables()
-            for table_name in tables:
-                try:
-                    # Get schema
-                    schema = inspector.get_table_schema(table_name)
-                    schema_metadata[table_name] = schema
-                except Exception as e:
-                    print(f"Error retrieving schema for table {table_name} in connection {conn['connection_id']}: {e}")
+        with ThreadPoolExecutor(max_workers=min(8, len(self.connections))) as executor:
+            # Each worker returns its own dict; merge in connection order
+            for conn_metadata in executor.map(self._fetch_one_connection, self.connections):
+                schema_metadata.update(conn_metadata)
         return schema_metadata
 
+    def _fetch_one_connection(self, conn):
+        """
+        Fetch every table schema of one connection.
+        """
+        inspector = UniversalSchemaInspector(conn)
+        inspector.connect()
+
+        # Get all tables
+        tables = inspector.get_all_tables()
+
+        def fetch(table_name):
+            try:
+                # Get schema
+                schema = inspector.get_table_schema(table_name)
+            except Exception as e:
+                print(f"Error retrieving schema for table {table_name} in connection {conn['connection_id']}: {e}")
+                return None
+
+            # Precompute lowercase column names/tokens for keyword coverage
+            schema["_col_names"], schema["_col_tokens"] = _column_sets(schema)
+            return schema
+
+        conn_metadata = {}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for table_name, schema in zip(tables, executor.map(fetch, tables)):
+                if schema is not None:
+                    conn_metadata[table_name] = schema
+        return conn_metadata
+
     def graph_ranker(self, combinations, historical_data):
    
 
@@ -38,9 +92,9 @@ class GraphRanker:
         # Time: ~50ms
 
         # Job 2: Model scoring
-        # 10 model calls - score each combo, return all with scores
+        # 1 batched model call - score all combos, return all with scores
         scored_top_10 = self.rank_with_model(top_10, self.question, self.schema_metadata)
-        # Time: ~200ms
+        # Time: ~30-50ms
         # Returns: [{score: 0.95, complexity: 2, combination: {...}}, ...]
 
         return scored_top_10
@@ -54,59 +108,48 @@ class GraphRanker:
         Output: Top 10 combinations
         Time: <50ms
         """
-        scored = []
+        if not combinations:
+            return []
 
-        for combo in combinations:
-            score = self.calculate_heuristic_score(combo, question, schema_metadata, historical_data)
-            scored.append((combo, score))
+        scores = self.heuristic_scores(combinations, question, schema_metadata)
 
-        # Sort by score, return top 10
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return [combo for combo, score in scored[:10]]
+        # Highest first; ties keep the Sheriff's order (like a stable sort)
+        top = np.argsort(-scores, kind="stable")[:10]
+        return [combinations[i] for i in top]
 
 
     def calculate_heuristic_score(self, combo, question, schema_metadata, historical_data):
         """
-        4-factor scoring formula.
+        4-factor scoring formula for one combo (see heuristic_scores).
         All factors use existing data - no model inference.
         """
-        score = 0.0
+        return float(self.heuristic_scores([combo], question, schema_metadata)[0])
+
 
+    def heuristic_scores(self, combinations, question, schema_metadata):
+        """
+        Heuristic score of every combo, in one vectorized expression.
+        """
         # Factor 1: Simplicity (30% weight)
         # From Joinability Sheriff output: combo["complexity"]
-        if combo["complexity"] == 1:
-            simplicity = 1.0  # Single table
-        elif combo["complexity"] == 2:
-            simplicity = 0.8  # Direct pair
-        else:
-            simplicity = 0.6  # Chain (3 tables)
-
-        score += 0.30 * simplicity
+        complexity = np.array([min(3, c["complexity"]) for c in combinations], dtype=np.int8)
 
         # Factor 2: Join Quality (20% weight)
         # From Joinability Sheriff output: combo["join_paths"]
-        num_joins = len(combo["join_paths"])
-
-        if num_joins == 0:
-            join_quality = 1.0  # Single table, no joins
-        elif num_joins == 1:
-            join_quality = 0.9  # One direct join
-        else:
-            join_quality = 0.7  # Multiple joins (chain)
-
-        score += 0.20 * join_quality
+        num_joins = np.array([min(2, len(c["join_paths"])) for c in combinations], dtype=np.int8)
 
         # Factor 3: Column Coverage (40% weight) ⬅️ LIGHTWEIGHT SEMANTIC CHECK
         # Check if combo has columns matching question keywords
-        coverage = self.calculate_column_coverage(combo, question, schema_metadata)
-        score += 0.40 * coverage
+        coverage = np.array([
+            self.calculate_column_coverage(c, question, schema_metadata) for c in combinations
+        ])
 
         # Factor 4: Historical Success (10% weight)
         # From historical logs: has this combo worked before?
       #  historical_score = self.get_historical_success(combo, historical_data)
        # score += 0.10 * historical_score
 
-        return score
+        return 0.30 * _SIMPLICITY[complexity] + 0.20 * _JOIN_QUALITY[num_joins] + 0.40 * coverage
 
 
     def calculate_column_coverage(self, combo, question, schema_metadata):
@@ -120,25 +163,29 @@ class GraphRanker:
         keywords = self.extract_keywords_simple(question)
         # Example: "active and inactive accounts" → ["active", "inactive", "accounts"]
 
-        # Step 2: Get all column names from this combo
-        combo_columns = []
-        for table_name in combo["tables"]:
-            table_schema = schema_metadata[table_name]
-            for col in table_schema["columns"]:
-                combo_columns.append(col["name"].lower())
+        # Calculate coverage
+        if len(keywords) == 0:
+            return 0.5  # Neutral if no keywords
+
+        # Step 2: Union the per-table column sets built in get_schema_metadata
+        # (computed here for schemas that didn't come from it)
+        column_sets = [
+            (t["_col_names"], t["_col_tokens"]) if "_col_tokens" in t else _column_sets(t)
+            for t in (schema_metadata[table_name] for table_name in combo["tables"])
+        ]
+        combo_columns = frozenset().union(*(names for names, _ in column_sets))
+        combo_tokens = frozenset().union(*(tokens for _, tokens in column_sets))
 
         # Step 3: Check keyword overlap with column names
         matches = 0
         for keyword in keywords:
-            for col_name in combo_columns:
-                # Fuzzy match: "status" matches "account_status"
-                if keyword in col_name or col_name in keyword:
-                    matches += 1
-                    break
-
-        # Calculate coverage
-        if len(keywords) == 0:
-            return 0.5  # Neutral if no keywords
+            # Exact token hit ("status" in "account_status") needs no scan;
+            # otherwise fall back to fuzzy substring match on full names
+            if keyword in combo_tokens or any(
+                keyword in col_name or col_name in keyword
+                for col_name in combo_columns
+            ):
+                matches += 1
 
         coverage = matches / len(keywords)
         return coverage
@@ -148,22 +195,16 @@ class GraphRanker:
         """
         Extract keywords WITHOUT model call.
         Simple approach: remove stop words, keep nouns/adjectives.
+        Cached per question, since every combo scores the same question.
         """
-        import re
-
-        # Simple stop words list
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-            'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'been',
-            'be', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
-            'should', 'could', 'may', 'might', 'must', 'can', 'get', 'show', 'list'
-        }
-
-        # Extract words
-        words = re.findall(r'\w+', question.lower())
-
-        # Filter: remove stop words, keep words > 3 chars
-        keywords = [w for w in words if w not in stop_words and len(w) > 3]
+        keywords = self._kw_cache.get(question)
+        if keywords is None:
+            # Filter: remove stop words, keep words > 3 chars
+            keywords = [
+                w for w in _WORD_RE.findall(question.lower())
+                if len(w) > 3 and w not in _STOP_WORDS
+            ]
+            self._kw_cache[question] = keywords
 
         return keywords
 
@@ -184,18 +225,18 @@ class GraphRanker:
         
     def rank_with_model(self, top_10_combos, question, schema_metadata):
         """
-        Score each combination individually using tiny model.
+        Score all combinations with the tiny model in one batch.
 
         Input: 10 combinations from Job 1
         Output: All 10 combinations with their scores (sorted by score)
-        Model calls: 10 (one per combo)
-        Time: ~200ms total (~20ms per call with 5MB model)
+        Model calls: 1 (batched forward pass over all combos)
+        Time: ~30-50ms total
         """
-        scored_combos = []
+        schemas = []
+        joins_list = []
 
-        # Score each combination individually
+        # Build the model inputs for every combination
         for combo in top_10_combos:
-            # Build prompt for this specific combo
             #prompt = self.build_scoring_prompt(question, combo, schema_metadata)
 
             tables = combo["tables"]
@@ -219,7 +260,7 @@ class GraphRanker:
                     columns_str = ", ".join(column_names)
                     schema_parts.append(f"Table: {table_name} ({columns_str})")
             
-            schema = "\\n".join(schema_parts)
+            schemas.append("\\n".join(schema_parts))
             
             # Build joins string
             joins_parts = []
@@ -233,20 +274,22 @@ class GraphRanker:
                 for from_col, to_col in zip(from_columns, to_columns):
                     joins_parts.append(f"{from_table}.{from_col} = {to_table}.{to_col}")
             
-            joins = "\\n".join(joins_parts) if joins_parts else ""
+            joins_list.append("\\n".join(joins_parts) if joins_parts else "")
 
-            # Call tiny model (5MB, very fast)
-            score = self.predictor.predict(question,schema,joins)
-
-            # Model returns float between 0-1
-            score = float(score.strip())
+        # Call tiny model once for all combos (5MB, very fast)
+        # Model returns floats between 0-1
+        scores = self.predictor.predict_batch(
+            [question] * len(top_10_combos), schemas, joins_list
+        )
 
+        scored_combos = []
+        for combo, score in zip(top_10_combos, scores):
             # Enrich with full metadata
             enriched = self.enrich_with_metadata(combo, schema_metadata)
 
             scored_combos.append({
                 "combination": enriched,
-                "score": score,
+                "score": float(score),
                 "complexity": combo["complexity"]
             })
 
@@ -2,9 +2,36 @@
 Query Score Inference - Simple API for using the trained model
 """
 
+import os
+import json
+import threading
+import socketserver
+from contextlib import nullcontext
+from functools import lru_cache
+
 import torch
 from transformers import AutoTokenizer
 from model_code import QueryScoreModel
+from config import get_settings
+
+DEFAULT_MODEL_PATH = 'model/final_model.pt'
+DEFAULT_TOKENIZER_PATH = 'model/'
+
+# Batch sizes a compiled model is run at, see predict_batch()
+BATCH_BUCKETS = (1, 8, 32)
+
+# Sequence lengths a compiled model is run at by predict(); the last one is max_length
+SEQ_BUCKETS = (64, 128, 256)
+
+# Entries kept by the per-predictor prompt and tokenizer caches
+TOKENIZE_CACHE_SIZE = 1024
+
+# Process-wide predictor, see get_predictor()
+_PREDICTOR = None
+_PREDICTOR_LOCK = threading.Lock()
+
+# Allow TF32 tensor cores for any matmuls left in float32
+torch.set_float32_matmul_precision('high')
 
 
 class QueryScorePredictor:
@@ -26,7 +53,17 @@ class QueryScorePredictor:
             Returns True if score > threshold
     """
 
-    def __init__(self, model_path, tokenizer_path, device='cpu'):
+    # Prompt template (see format_input). The tokenizer drops whitespace, so
+    # this tokenizes exactly like the indented prompt the model was trained on.
+    _TMPL = (
+        "Query: {q}\n"
+        "Schema: {s}\n"
+        "Joins: {j}\n"
+        "Score (0-1) how well these tables can answer the question:"
+    )
+
+    def __init__(self, model_path, tokenizer_path, device='cpu', compile=True, dtype=None,
+                 backend='torch', quantize=None, intra_op_threads=1):
         """
         Initialize the predictor.
 
@@ -34,6 +71,20 @@ class QueryScorePredictor:
             model_path: Path to trained model (.pt file)
             tokenizer_path: Path to tokenizer directory
             device: 'cpu' or 'cuda' (default: 'cpu')
+            compile: Compile the model with torch.compile (default: True).
+                Falls back to eager mode if compilation fails.
+            dtype: Inference precision (default: torch.bfloat16 on CUDA,
+                torch.float32 on CPU)
+            backend: 'torch' or 'onnx' (default: 'torch'). 'onnx' runs the
+                model with ONNX Runtime on the CPU, exporting it next to
+                model_path (same name, .onnx) if no export exists yet.
+            quantize: int8 dynamic quantization of Linear layers for the
+                torch backend on CPU (default: None = only when the CPU has
+                VNNI int8 instructions; it can be slower without them)
+            intra_op_threads: ONNX Runtime threads per op (default: 1).
+                torch's thread pools are process-wide and are left alone
+                here; a dedicated predictor process sizes them once with
+                set_cpu_threads().
 
         Example:
             predictor = QueryScorePredictor(
@@ -41,22 +92,131 @@ class QueryScorePredictor:
                 tokenizer_path='model/'
             )
         """
+        if backend not in ('torch', 'onnx'):
+            raise ValueError(f"Unknown backend: {backend}")
         self.device = torch.device(device)
+        if backend == 'onnx' and self.device.type != 'cpu':
+            raise ValueError("The ONNX backend only runs on the CPU")
+        self.intra_op_threads = intra_op_threads
+        self.backend = backend
+        if dtype is None:
+            dtype = torch.bfloat16 if self.device.type == 'cuda' else torch.float32
+        self.dtype = dtype
         self.max_length = 256
 
         # Load tokenizer
         print(f"Loading tokenizer from {tokenizer_path}...")
         self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        # Repeated (query, schema, joins) inputs skip prompt building and tokenization
+        self._format = lru_cache(maxsize=TOKENIZE_CACHE_SIZE)(self.format_input)
+        self._tokenize = lru_cache(maxsize=TOKENIZE_CACHE_SIZE)(self._tokenize_text)
 
         # Load model
         print(f"Loading model from {model_path}...")
         self.model = QueryScoreModel()
-        checkpoint = torch.load(model_path, map_location=self.device)
-        self.model.load_state_dict(checkpoint['model_state_dict'])
-        self.model.to(self.device)
+        # Tensors only (no pickled objects), memory-mapped rather than read into RAM;
+        # assign=True adopts the checkpoint tensors instead of copying into fresh ones
+        checkpoint = torch.load(model_path, map_location=self.device, mmap=True, weights_only=True)
+        self.model.load_state_dict(checkpoint['model_state_dict'], assign=True)
+        self.model.to(self.device, dtype=self.dtype)
         self.model.eval()
+        if quantize is None:
+            quantize = _has_vnni()
+        self.quantized = (
+            quantize and backend == 'torch'
+            and self.device.type == 'cpu' and self.dtype == torch.float32
+        )
+        if self.quantized:
+            self._quantize_model()
+        self.compiled = False
+        self.session = None
+        if backend == 'onnx':
+            self.session = self._load_onnx_session(model_path)
+        elif compile:
+            self._compile_model()
         print("✓ Model loaded successfully!\n")
 
+    def _quantize_model(self):
+        """Swap Linear layers for int8 dynamically quantized ones (CPU only)."""
+        if 'fbgemm' in torch.backends.quantized.supported_engines:
+            # x86 int8 GEMM kernels
+            torch.backends.quantized.engine = 'fbgemm'
+        self.model = torch.ao.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    def _compile_model(self):
+        """
+        Compile the model with TorchInductor and warm it up.
+
+        Compilation and warm-up run under inference_mode, the same mode
+        used for prediction. Keeps the eager model if anything fails
+        (e.g. no C++ toolchain for Inductor on CPU).
+        """
+        eager_model = self.model
+        try:
+            with torch.inference_mode(), self._autocast():
+                # dynamic=False: one static graph per input shape (the buckets)
+                compiled_model = torch.compile(
+                    eager_model, mode="reduce-overhead", fullgraph=True, dynamic=False
+                )
+                # Warm up every (1, seq bucket) shape predict() uses,
+                # so the first real call doesn't pay for compilation
+                for seq_len in SEQ_BUCKETS:
+                    dummy_ids = torch.zeros((1, seq_len), dtype=torch.long, device=self.device)
+                    compiled_model(dummy_ids, torch.ones_like(dummy_ids))
+        except Exception as e:
+            print(f"torch.compile unavailable, using eager model: {e}")
+            return
+        self.model = compiled_model
+        self.compiled = True
+
+    def _load_onnx_session(self, model_path):
+        """
+        Create an ONNX Runtime session for the model.
+
+        Prefers the int8 <model_path>.qdq.onnx built by quantize_model.py.
+        Otherwise uses the float32 <model_path>.onnx, exporting it on first use.
+        """
+        import onnxruntime as ort
+
+        base_path = os.path.splitext(model_path)[0]
+        onnx_path = base_path + '.qdq.onnx'
+        if not os.path.exists(onnx_path):
+            onnx_path = base_path + '.onnx'
+            if not os.path.exists(onnx_path):
+                self.export_onnx(onnx_path)
+
+        print(f"Loading ONNX model from {onnx_path}...")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = 1
+        return ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def export_onnx(self, onnx_path):
+        """
+        Export the float32 model to ONNX (dynamic batch and sequence axes).
+
+        Args:
+            onnx_path: Output .onnx file
+        """
+        print(f"Exporting model to {onnx_path}...")
+        dummy_ids = torch.zeros((1, self.max_length), dtype=torch.long)
+        torch.onnx.export(
+            self.model,
+            (dummy_ids, torch.ones_like(dummy_ids)),
+            onnx_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['score'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'seq'},
+                'attention_mask': {0: 'batch', 1: 'seq'},
+                'score': {0: 'batch'}
+            },
+            opset_version=17,
+            dynamo=False
+        )
+
     def format_input(self, query, schema, joins):
         """
         Format query, schema, and joins into model input.
@@ -76,10 +236,7 @@ class QueryScorePredictor:
                 joins="employees.dept_id = departments.id"
             )
         """
-        return f"""Query: {query}
-                   Schema: {schema}
-                   Joins: {joins}
-                   Score (0-1) how well these tables can answer the question:"""
+        return self._TMPL.format(q=query, s=schema, j=joins)
 
     def predict(self, query, schema, joins):
         """
@@ -105,24 +262,17 @@ class QueryScorePredictor:
             # Returns: 0.9280
         """
         # Format input
-        text = self.format_input(query, schema, joins)
-
-        # Tokenize
-        encoding = self.tokenizer(
-            text,
-            max_length=self.max_length,
-            truncation=True,
-            padding='max_length',
-            return_tensors='pt'
-        )
+        text = self._format(query, schema, joins)
 
-        input_ids = encoding['input_ids'].to(self.device)
-        attention_mask = encoding['attention_mask'].to(self.device)
+        # Tokenize: eager runs the real length, a compiled model the nearest bucket
+        pad_to = None
+        if self.compiled:
+            num_tokens = len(self._tokenize(text)[0])
+            pad_to = next((b for b in SEQ_BUCKETS if b >= num_tokens), self.max_length)
+        encoding = self._encode([text], pad_to=pad_to)
 
         # Predict
-        with torch.no_grad():
-            score = self.model(input_ids, attention_mask)
-
+        score = self._predict_tensors(encoding)
         return score.item()
 
     def predict_batch(self, queries, schemas, joins_list):
@@ -137,6 +287,11 @@ class QueryScorePredictor:
         Returns:
             List of confidence scores (floats 0.0-1.0)
 
+        Note:
+            A compiled model only ever sees (bucket, max_length) inputs, with
+            bucket from BATCH_BUCKETS, so graphs are captured once per bucket
+            and replayed afterwards. The first call per bucket is slow.
+
         Example:
             scores = predictor.predict_batch(
                 queries=["Find employees", "Show orders", "List products"],
@@ -145,12 +300,107 @@ class QueryScorePredictor:
             )
             # Returns: [0.9280, 0.0987, 0.7234]
         """
+        texts = [
+            self._format(query, schema, joins)
+            for query, schema, joins in zip(queries, schemas, joins_list)
+        ]
+        if not texts:
+            return []
+
+        # Score each distinct prompt once, then scatter scores back by position
+        unique = {}
+        positions = [unique.setdefault(text, len(unique)) for text in texts]
+        unique_texts = list(unique)
+
+        scores = self._score_texts(unique_texts)
+        return [scores[i] for i in positions]
+
+    def _score_texts(self, texts):
+        """Score formatted prompts (see predict_batch)."""
+        if not self.compiled:
+            # Tokenize the whole batch, padded to its longest input
+            encoding = self._encode(texts)
+
+            # One forward pass for all inputs
+            scores = self._predict_tensors(encoding)
+            return scores.tolist()
+
+        # Compiled model: keep input shapes static so captured graphs are reused
         scores = []
-        for query, schema, joins in zip(queries, schemas, joins_list):
-            score = self.predict(query, schema, joins)
-            scores.append(score)
+        max_bucket = BATCH_BUCKETS[-1]
+        for start in range(0, len(texts), max_bucket):
+            chunk = texts[start:start + max_bucket]
+            bucket = next(b for b in BATCH_BUCKETS if b >= len(chunk))
+            # Fill the bucket with copies of the last entry, dropped again below
+            padded = chunk + [chunk[-1]] * (bucket - len(chunk))
+            encoding = self._encode(padded, pad_to=self.max_length)
+            scores.extend(self._predict_tensors(encoding)[:len(chunk)].tolist())
         return scores
 
+    def _tokenize_text(self, text):
+        """
+        Tokenize one prompt without padding (cached as self._tokenize).
+
+        Returns:
+            (input_ids, attention_mask) as tuples, so cache entries are immutable
+        """
+        encoding = self.tokenizer(text, max_length=self.max_length, truncation=True)
+        return tuple(encoding['input_ids']), tuple(encoding['attention_mask'])
+
+    def _encode(self, texts, pad_to=None):
+        """
+        Tokenize prompts through the cache and pad them into one batch.
+
+        Args:
+            texts: List of formatted prompts
+            pad_to: Sequence length to pad to (default: longest prompt)
+
+        Returns:
+            Dict with 'input_ids' and 'attention_mask' tensors [batch_size, seq_len]
+        """
+        encoded = [self._tokenize(text) for text in texts]
+        seq_len = pad_to or max(len(ids) for ids, _ in encoded)
+
+        input_ids = torch.full((len(encoded), seq_len), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(encoded), seq_len), dtype=torch.long)
+        for row, (ids, mask) in enumerate(encoded):
+            input_ids[row, :len(ids)] = torch.as_tensor(ids)
+            attention_mask[row, :len(mask)] = torch.as_tensor(mask)
+        return {'input_ids': input_ids, 'attention_mask': attention_mask}
+
+    def _predict_tensors(self, encoding):
+        """
+        Run the model on a tokenizer encoding.
+
+        Args:
+            encoding: Dict with 'input_ids' and 'attention_mask' tensors
+
+        Returns:
+            Tensor of scores [batch_size], on the CPU
+        """
+        if self.session is not None:
+            # ONNX Runtime takes numpy inputs and returns numpy outputs
+            outputs = self.session.run(None, {
+                'input_ids': encoding['input_ids'].numpy(),
+                'attention_mask': encoding['attention_mask'].numpy()
+            })
+            return torch.from_numpy(outputs[0])
+
+        input_ids = encoding['input_ids'].to(self.device, non_blocking=True)
+        attention_mask = encoding['attention_mask'].to(self.device, non_blocking=True)
+
+        # inference_mode skips autograd bookkeeping entirely (cheaper than no_grad)
+        with torch.inference_mode(), self._autocast():
+            scores = self.model(input_ids, attention_mask)
+
+        return scores.detach().float().cpu()
+
+    def _autocast(self):
+        """Autocast context for self.dtype; a no-op at full precision."""
+        if self.dtype == torch.float32:
+            return nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self.dtype)
+
     def is_answerable(self, query, schema, joins, threshold=0.5):
         """
         Check if query is answerable with given schema.
@@ -179,6 +429,100 @@ class QueryScorePredictor:
         score = self.predict(query, schema, joins)
         return score > threshold
 
+    def serve(self, host='127.0.0.1', port=8765):
+        """
+        Serve predictions from this process over TCP, so the model, tokenizer
+        caches and compiled graphs are loaded once and shared by all clients.
+
+        Protocol: one JSON object per line in each direction.
+            request:  {"queries": [...], "schemas": [...], "joins_list": [...]}
+            response: {"scores": [...]} or {"error": "..."}
+
+        With compile=True the warm-up runs in __init__, but the first request
+        per batch bucket still captures its graphs and is slow.
+
+        Args:
+            host: Interface to bind (default: 127.0.0.1)
+            port: TCP port (default: 8765)
+        """
+        predictor = self
+        # Connections are handled on separate threads; forwards run one at a time
+        model_lock = threading.Lock()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line)
+                        with model_lock:
+                            scores = predictor.predict_batch(
+                                request["queries"], request["schemas"], request["joins_list"]
+                            )
+                        response = {"scores": scores}
+                    except Exception as e:
+                        response = {"error": str(e)}
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        with Server((host, port), Handler) as server:
+            print(f"Serving predictions on {host}:{port}")
+            server.serve_forever()
+
+
+def set_cpu_threads(intra_op_threads=1, inter_op_threads=1):
+    """
+    Size torch's CPU thread pools for a tiny model. Thread fork/join costs
+    more than bert-tiny's per-op work, so 1-2 threads is fastest.
+
+    The pools are process-wide (they are shared with e.g. the
+    SentenceTransformer encoder in the API process), so only call this once
+    at startup of a process dedicated to the predictor, before the model
+    runs (the inter-op pool can't be resized after its first use).
+    """
+    torch.set_num_threads(intra_op_threads)
+    try:
+        torch.set_num_interop_threads(inter_op_threads)
+    except RuntimeError:
+        # Can only be set once, before any inter-op parallel work
+        print("Inter-op threads already fixed for this process, keeping them")
+
+
+def _has_vnni():
+    """True if the CPU supports VNNI int8 dot products."""
+    is_vnni_supported = getattr(torch.cpu, '_is_vnni_supported', None)
+    return bool(is_vnni_supported and is_vnni_supported())
+
+
+def get_predictor():
+    """
+    Get the shared predictor, loading it on first use.
+
+    Loading the checkpoint and tokenizer takes hundreds of milliseconds,
+    so callers should use this instead of building their own predictor.
+
+    The backend is taken from Settings.query_score_backend
+    (QUERY_SCORE_BACKEND in the environment or .env).
+
+    Returns:
+        QueryScorePredictor loaded from DEFAULT_MODEL_PATH
+    """
+    global _PREDICTOR
+    if _PREDICTOR is None:
+        with _PREDICTOR_LOCK:
+            if _PREDICTOR is None:
+                _PREDICTOR = QueryScorePredictor(
+                    model_path=DEFAULT_MODEL_PATH,
+                    tokenizer_path=DEFAULT_TOKENIZER_PATH,
+                    backend=get_settings().query_score_backend
+                )
+    return _PREDICTOR
+
 
 # Command-line interface
 if __name__ == "__main__":
@@ -186,22 +530,36 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description='Query Score Predictor')
-    parser.add_argument('--model_path', default='model/final_model.pt', help='Path to model file')
-    parser.add_argument('--tokenizer_path', default='model/', help='Path to tokenizer directory')
+    parser.add_argument('--model_path', default=DEFAULT_MODEL_PATH, help='Path to model file')
+    parser.add_argument('--tokenizer_path', default=DEFAULT_TOKENIZER_PATH, help='Path to tokenizer directory')
     parser.add_argument('--query', help='Query string')
     parser.add_argument('--schema', help='Schema description')
     parser.add_argument('--joins', help='Join conditions')
+    parser.add_argument('--no_compile', action='store_true', help='Skip torch.compile')
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnx'], help='Inference backend')
+    parser.add_argument('--serve', action='store_true', help='Serve predictions over TCP (see serve())')
+    parser.add_argument('--host', default='127.0.0.1', help='Host for --serve')
+    parser.add_argument('--port', type=int, default=8765, help='Port for --serve')
+    parser.add_argument('--threads', type=int, default=1, help='torch CPU threads per op')
 
     args = parser.parse_args()
 
+    # This process only runs the predictor: size torch's thread pools once, up front
+    set_cpu_threads(args.threads)
+
     # Initialize predictor
     predictor = QueryScorePredictor(
         model_path=args.model_path,
-        tokenizer_path=args.tokenizer_path
+        tokenizer_path=args.tokenizer_path,
+        compile=not args.no_compile,
+        backend=args.backend,
+        intra_op_threads=args.threads
     )
 
+    if args.serve:
+        predictor.serve(args.host, args.port)
     # If arguments provided, run prediction
-    if args.query and args.schema and args.joins:
+    elif args.query and args.schema and args.joins:
         score = predictor.predict(args.query, args.schema, args.joins)
         print(f"\nQuery: {args.query}")
         print(f"Score: {score:.4f}")
@@ -1,11 +1,17 @@
+import numpy as np
+
+
 class JoinabilitySheriff:
     """
     Simple, mechanical FK-based combination generator.
     No fallbacks. No inference. Just FKs.
     """
 
-    def __init__(self, metadata_store):
+    def __init__(self, metadata_store, use_sql=False):
         self.metadata_store = metadata_store
+        # Enumerate combinations in Postgres (one round-trip, nothing cached)
+        # instead of from the FK map in Python
+        self.use_sql = use_sql
 
     def generate_combinations(self, selected_tables):
         """
@@ -40,7 +46,12 @@ class JoinabilitySheriff:
             }
 
         connection_id = list(connection_ids)[0]
-        table_names = [t["table_name"] for t in selected_tables]
+        # Shared by every generator below
+        table_names = {t["table_name"] for t in selected_tables}
+        table_scores = {t["table_name"]: t["similarity_score"] for t in selected_tables}
+
+        if self.use_sql:
+            return self.generate_combinations_sql(table_names, table_scores, connection_id)
 
         # Get FK map from metadata store
         fk_map = self.metadata_store.get_fk_map(connection_id, table_names)
@@ -53,10 +64,14 @@ class JoinabilitySheriff:
 
         # Step 2: Pairs (only if FK exists)
         if fk_map:
-            combinations.extend(self.generate_pairs(selected_tables, fk_map))
+            combinations.extend(
+                self.generate_pairs(fk_map, table_names, table_scores, connection_id)
+            )
 
             # Step 3: Chains (only if FK paths exist)
-            combinations.extend(self.generate_chains(selected_tables, fk_map))
+            combinations.extend(
+                self.generate_chains(fk_map, table_names, table_scores, connection_id)
+            )
 
         # Step 4: Cap at 30
         if len(combinations) > 30:
@@ -71,6 +86,36 @@ class JoinabilitySheriff:
             }
         }
 
+    def generate_combinations_sql(self, table_names, table_scores, connection_id):
+        """
+        Same result as generate_combinations, built by a recursive CTE.
+        See MetadataStore.get_top_combinations.
+        """
+        rows = self.metadata_store.get_top_combinations(connection_id, table_scores, limit=30)
+
+        combinations = [
+            {
+                "tables": row["tables"],
+                "similarity_score": row["similarity_score"],
+                "connection_id": connection_id,
+                "join_paths": row["join_paths"],
+                "complexity": len(row["tables"])
+            }
+            for row in rows
+        ]
+
+        return {
+            "combinations": combinations,
+            "metadata": {
+                "total_combinations": len(combinations),
+                "connection_id": connection_id,
+                # Same count as len(fk_map) in generate_combinations
+                "fk_relationships_found": self.metadata_store.count_fk_tables(
+                    connection_id, table_names
+                )
+            }
+        }
+
     def generate_singles(self, selected_tables):
         """
         Generate single-table combinations.
@@ -87,106 +132,144 @@ class JoinabilitySheriff:
             for table in selected_tables
         ]
 
-    def generate_pairs(self, selected_tables, fk_map):
+    def generate_pairs(self, fk_map, table_names, table_scores, connection_id, limit=30):
         """
         Generate 2-table combinations where FK relationship exists.
+        Only the `limit` best-scoring pairs are built (never more than fit in the cap).
+        Equal scores keep input order: by from table, then to table.
         """
-        combinations = []
-        table_names = {t["table_name"] for t in selected_tables}
-        table_scores = {t["table_name"]: t["similarity_score"] for t in selected_tables}
-        connection_id = selected_tables[0]["connection_id"]
+        # Stage pairs as (from, to, fk_info); score them all at once below
+        edges = []
+
+        # Walk the selection in input order (not FK map order) so ties are stable
+        for from_table in table_scores:
+            fk_targets = fk_map.get(from_table)
 
-        # Loop through FK map
-        for from_table, fk_targets in fk_map.items():
-            # Check if from_table is in selected tables
-            if from_table not in table_names:
+            # Skip tables with no FK into the selection at all
+            if not fk_targets or table_names.isdisjoint(fk_targets):
                 continue
 
-            for to_table, fk_info in fk_targets.items():
-                # Check if to_table is in selected tables
-                if to_table not in table_names:
-                    continue
-
-                # Generate combination
-                combinations.append({
-                    "tables": [from_table, to_table],
-                    "similarity_score": (
-                        (table_scores[from_table]+
-                        table_scores[to_table]) / 2
-                    ),
-                    "connection_id": connection_id,
-                    "join_paths": [
-                        {
-                            "from_table": from_table,
-                            "to_table": to_table,
-                            "from_columns": fk_info["from_columns"],
-                            "to_columns": fk_info["to_columns"]
-                        }
-                    ],
-                    "complexity": 2
-                })
-
-        return sorted(combinations, key=lambda x: x["similarity_score"], reverse=True)
-
-    def generate_chains(self, selected_tables, fk_map):
+            for to_table in table_scores:
+                fk_info = fk_targets.get(to_table)
+                if fk_info is not None:
+                    edges.append((from_table, to_table, fk_info))
+
+        if not edges:
+            return []
+
+        scores = np.fromiter(
+            (table_scores[from_table] for from_table, _, _ in edges), dtype=np.float64, count=len(edges)
+        )
+        scores += np.fromiter(
+            (table_scores[to_table] for _, to_table, _ in edges), dtype=np.float64, count=len(edges)
+        )
+        scores /= 2
+
+        # Generate combinations, best first
+        combinations = []
+        for i in _top_indices(scores, limit):
+            from_table, to_table, fk_info = edges[i]
+            combinations.append({
+                "tables": [from_table, to_table],
+                "similarity_score": float(scores[i]),
+                "connection_id": connection_id,
+                "join_paths": [
+                    {
+                        "from_table": from_table,
+                        "to_table": to_table,
+                        "from_columns": fk_info["from_columns"],
+                        "to_columns": fk_info["to_columns"]
+                    }
+                ],
+                "complexity": 2
+            })
+
+        return combinations
+
+    def generate_chains(self, fk_map, table_names, table_scores, connection_id, limit=30):
         """
         Generate 3-table combinations by following FK paths.
         Avoid cycles.
+        Only the `limit` best-scoring chains are built (never more than fit in the cap).
+        Equal scores keep input order of the first, second, then third table.
         """
-        combinations = []
-        table_names = {t["table_name"] for t in selected_tables}
-        table_scores = {t["table_name"]: t["similarity_score"] for t in selected_tables}
-        connection_id = selected_tables[0]["connection_id"]
-
-        # Loop through all possible starting tables
-        for table1, fk_targets_1 in fk_map.items():
-            if table1 not in table_names:
-                continue
-
-            # Loop through tables connected to table1
-            for table2, fk_info_1 in fk_targets_1.items():
-                if table2 not in table_names:
-                    continue
+        # Index selected tables so chains can be staged as integer arrays
+        index = {name: i for i, name in enumerate(table_scores)}
+        score_arr = np.fromiter(table_scores.values(), dtype=np.float64, count=len(table_scores))
 
-                # Check if table2 has FKs
-                if table2 not in fk_map:
-                    continue
+        # FK edges between selected tables only, in input order
+        adj = {
+            table: [
+                (to_table, fk_map[table][to_table])
+                for to_table in table_scores
+                if to_table in fk_map[table]
+            ]
+            for table in table_scores
+            if table in fk_map
+        }
 
+        # Stage every chain as table indices plus its two FK infos
+        idx_1, idx_2, idx_3, fk_infos = [], [], [], []
+        for table1, targets_1 in adj.items():
+            for table2, fk_info_1 in targets_1:
                 # Loop through tables connected to table2
-                for table3, fk_info_2 in fk_map[table2].items():
-                    if table3 not in table_names:
-                        continue
-
+                for table3, fk_info_2 in adj.get(table2, ()):
                     # Avoid cycles: table3 shouldn't be table1
                     if table3 == table1:
                         continue
 
-                    # Generate 3-table chain
-                    combinations.append({
-                        "tables": [table1, table2, table3],
-                        "similarity_score": (
-                            (table_scores[table1]+
-                            table_scores[table2]+
-                            table_scores[table3]) / 3
-                        ),
-                        "connection_id": connection_id,
-                        "join_paths": [
-                            {
-                                "from_table": table1,
-                                "to_table": table2,
-                                "from_columns": fk_info_1["from_columns"],
-                                "to_columns": fk_info_1["to_columns"]
-                            },
-                            {
-                                "from_table": table2,
-                                "to_table": table3,
-                                "from_columns": fk_info_2["from_columns"],
-                                "to_columns": fk_info_2["to_columns"]
-                            }
-                        ],
-                        "complexity": 3
-                    })
-
-        # Limit chains to prevent explosion
-        return sorted(combinations, key=lambda x: x["similarity_score"], reverse=True)
-     #combinations[:10]
\ No newline at end of file
+                    idx_1.append(index[table1])
+                    idx_2.append(index[table2])
+                    idx_3.append(index[table3])
+                    fk_infos.append((fk_info_1, fk_info_2))
+
+        if not fk_infos:
+            return []
+
+        idx_1, idx_2, idx_3 = np.array(idx_1), np.array(idx_2), np.array(idx_3)
+        scores = (score_arr[idx_1] + score_arr[idx_2] + score_arr[idx_3]) / 3
+
+        # Generate 3-table chains, best first
+        names = list(table_scores)
+        combinations = []
+        for i in _top_indices(scores, limit):
+            table1, table2, table3 = names[idx_1[i]], names[idx_2[i]], names[idx_3[i]]
+            fk_info_1, fk_info_2 = fk_infos[i]
+            combinations.append({
+                "tables": [table1, table2, table3],
+                "similarity_score": float(scores[i]),
+                "connection_id": connection_id,
+                "join_paths": [
+                    {
+                        "from_table": table1,
+                        "to_table": table2,
+                        "from_columns": fk_info_1["from_columns"],
+                        "to_columns": fk_info_1["to_columns"]
+                    },
+                    {
+                        "from_table": table2,
+                        "to_table": table3,
+                        "from_columns": fk_info_2["from_columns"],
+                        "to_columns": fk_info_2["to_columns"]
+                    }
+                ],
+                "complexity": 3
+            })
+
+        return combinations
+
+
+def _top_indices(scores, limit):
+    """
+    Indices of the `limit` highest scores, best first.
+    Same order as a stable descending sort (earlier index wins ties).
+    """
+    if len(scores) > limit:
+        # Partition instead of sorting everything; keep boundary ties in index order
+        kth = -np.partition(-scores, limit - 1)[limit - 1]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[:limit - len(above)]
+        candidates = np.sort(np.concatenate([above, tied]))
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -3,24 +3,32 @@ from embedding_manager import EmbeddingManager
 from sync_orchestrator import SchemaSyncOrchestrator
 from schema_scout import SchemaScout
 from joinability_sheriff import JoinabilitySheriff
-from config import METADATA_DB_CONFIG, MILVUS_CONFIG, MYSQL_CONNECTION
+from config import get_settings, get_milvus_config
+import logging
 
 
 def main():
     """
     Main script to sync MySQL database schema to Milvus.
     """
+    settings = get_settings()
+    mysql_connection = settings.mysql_connection()
+
     print("=" * 60)
     print("Step 0: Connection & Metadata Management")
     print("=" * 60)
 
     # Initialize components
     print("\n1. Initializing metadata store (PostgreSQL)...")
-    metadata_store = MetadataStore(METADATA_DB_CONFIG)
+    metadata_store = MetadataStore(settings.metadata_db_dict(), settings.metadata_pool_dict())
     print("✓ Metadata store ready")
 
     print("\n2. Initializing embedding manager (Milvus)...")
-    embedding_manager = EmbeddingManager(MILVUS_CONFIG)
+    embedding_manager = EmbeddingManager(
+        get_milvus_config(),
+        cache_path=settings.embedding_cache_path,
+        cache_max_rows=settings.embedding_cache_max_rows,
+    )
     print("✓ Embedding manager ready")
 
     print("\n3. Creating sync orchestrator...")
@@ -30,12 +38,12 @@ def main():
 
     # Sync MySQL database
     print("\n4. Syncing MySQL database...")
-    print(f"   Connection ID: {MYSQL_CONNECTION['connection_id']}")
-    print(f"   Database: {MYSQL_CONNECTION['database']}")
-    print(f"   Host: {MYSQL_CONNECTION['host']}")
+    print(f"   Connection ID: {mysql_connection['connection_id']}")
+    print(f"   Database: {mysql_connection['database']}")
+    print(f"   Host: {mysql_connection['host']}")
     print("-" * 60)
-    metadata_store.register_connection(MYSQL_CONNECTION)
-    result = orchestrator.sync_connection(MYSQL_CONNECTION)
+    metadata_store.register_connection(mysql_connection)
+    result = orchestrator.sync_connection(mysql_connection)
 
     print("\n" + "=" * 60)
     print("Sync Complete!")
@@ -53,7 +61,7 @@ def main():
     while option:
         user_question = input("\nEnter a question about your database schema: ")
 
-        table_information = schema_scout.search_tables(user_question, connection_ids=[MYSQL_CONNECTION['connection_id']], top_k=5)
+        table_information = schema_scout.search_tables(user_question, connection_ids=[mysql_connection['connection_id']], top_k=5)
 
         print(table_information)
 
@@ -71,4 +79,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Keep the sync progress lines visible on the CLI
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     main()
\ No newline at end of file
@@ -1,7 +1,34 @@
 import psycopg2
-import json
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+from collections import OrderedDict
+import threading
+import orjson
 from datetime import datetime
 
+# Max get_fk_map results kept in memory
+FK_CACHE_SIZE = 1024
+
+# Hot lookups, run as server-side prepared statements (see _execute_prepared)
+_PREPARED_STATEMENTS = {
+    "get_fk_map": """
+        SELECT from_table, tos
+        FROM fk_map_cache
+        WHERE connection_id = $1
+          AND from_table = ANY($2)
+    """,
+}
+
+
+class _PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements it has PREPAREd."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
 
 class MetadataStore:
     """
@@ -9,12 +36,56 @@ class MetadataStore:
     Fast lookup for FK relationships.
     """
 
-    def __init__(self, db_config):
-        self.conn = psycopg2.connect(**db_config)
+    def __init__(self, db_config, pool_config=None):
+        pool_config = pool_config or {}
+        maxconn = pool_config.get("maxconn", 20)
+        self.pool = ThreadedConnectionPool(
+            pool_config.get("minconn", 1),
+            maxconn,
+            connection_factory=_PreparingConnection,
+            **db_config
+        )
+        # getconn() raises when the pool is exhausted; wait for a slot instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # (connection_id, frozenset(table_names)) -> fk_map, LRU order
+        self._fk_cache = OrderedDict()
+        self._fk_cache_lock = threading.Lock()
         self.ensure_tables_exist()
 
+    @contextmanager
+    def _connection(self):
+        """
+        Borrow a pooled connection for one transaction.
+        Commits on success, rolls back on error, always returns it to the pool.
+        """
+        with self._slots:
+            conn = self.pool.getconn()
+            try:
+                # psycopg2's connection context commits, or rolls back on error
+                with conn:
+                    yield conn
+            finally:
+                self.pool.putconn(conn)
+
+    def _execute_prepared(self, cur, name, params):
+        """
+        EXECUTE a statement from _PREPARED_STATEMENTS.
+        PREPAREs it the first time the connection runs it, so repeat calls
+        skip parsing and planning.
+        """
+        conn = cur.connection
+        if name not in conn.prepared:
+            cur.execute(f"PREPARE {name} AS {_PREPARED_STATEMENTS[name]}")
+            conn.prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+    def close(self):
+        """Close every pooled connection."""
+        self.pool.closeall()
+
     def register_connection(self, connection_info):
-        with self.conn.cursor() as cur:
+        with self._connection() as conn, conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO connections
                 (connection_id, name, type, host, port, database, status, created_at)
@@ -44,9 +115,50 @@ class MetadataStore:
             else:
                 print(f"✓ Connection updated: {connection_info['connection_id']}")
 
+    def register_connections_bulk(self, connection_infos):
+        """
+        Register many connections in one statement and one transaction.
+        """
+        # One row per connection_id; ON CONFLICT can't touch a row twice
+        rows = {
+            info["connection_id"]: (
+                info["connection_id"],
+                info.get("name", info["connection_id"]),
+                info["type"],
+                info["host"],
+                info["port"],
+                info["database"],
+                "active"
+            )
+            for info in connection_infos
+        }
+        if not rows:
+            return
+
+        with self._connection() as conn, conn.cursor() as cur:
+            results = execute_values(cur, """
+                INSERT INTO connections
+                (connection_id, name, type, host, port, database, status)
+                VALUES %s
+                ON CONFLICT (connection_id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    type = EXCLUDED.type,
+                    host = EXCLUDED.host,
+                    port = EXCLUDED.port,
+                    database = EXCLUDED.database,
+                    status = EXCLUDED.status
+                RETURNING connection_id, (xmax = 0) AS inserted
+            """, list(rows.values()), fetch=True)
+
+            for connection_id, was_inserted in results:
+                if was_inserted:
+                    print(f"✓ New connection registered: {connection_id}")
+                else:
+                    print(f"✓ Connection updated: {connection_id}")
+
     def ensure_tables_exist(self):
         """Create metadata tables if they don't exist."""
-        with self.conn.cursor() as cur:
+        with self._connection() as conn, conn.cursor() as cur:
             # Connections table
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS connections (
@@ -76,6 +188,13 @@ class MetadataStore:
                 )
             """)
 
+            # Catalog fingerprint (see UniversalSchemaInspector.get_cheap_fingerprint);
+            # added separately so existing stores pick it up
+            cur.execute("""
+                ALTER TABLE table_metadata
+                ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)
+            """)
+
             # Foreign keys cache (for fast lookup)
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS foreign_keys (
@@ -97,100 +216,304 @@ class MetadataStore:
                 ON foreign_keys(connection_id, from_table)
             """)
 
-            self.conn.commit()
+            # FK map pre-grouped per from_table (what get_fk_map reads).
+            # Refreshed by refresh_fk_map after syncs that stored schemas.
+            cur.execute("""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS fk_map_cache AS
+                SELECT
+                    connection_id,
+                    from_table,
+                    jsonb_object_agg(to_table, jsonb_build_object(
+                        'from_columns', from_columns,
+                        'to_columns', to_columns,
+                        'confidence', confidence,
+                        'source', source
+                    )) AS tos
+                FROM foreign_keys
+                GROUP BY connection_id, from_table
+            """)
+
+            # Unique index required by REFRESH ... CONCURRENTLY
+            cur.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_fk_map_cache
+                ON fk_map_cache(connection_id, from_table)
+            """)
 
     def store_table_schema(self, schema, connection_info):
         """Store or update table schema."""
-        with self.conn.cursor() as cur:
+        with self._connection() as conn, conn.cursor() as cur:
             
 
             cur.execute("""
                 INSERT INTO table_metadata
-                (connection_id, table_name, schema_data, schema_hash, row_count)
-                VALUES (%s, %s, %s, %s, %s)
+                (connection_id, table_name, schema_data, schema_hash, row_count, fingerprint)
+                VALUES (%s, %s, %s, %s, %s, %s)
                 ON CONFLICT (connection_id, table_name)
                 DO UPDATE SET
                     schema_data = EXCLUDED.schema_data,
                     schema_hash = EXCLUDED.schema_hash,
                     row_count = EXCLUDED.row_count,
+                    fingerprint = EXCLUDED.fingerprint,
                     last_analyzed = NOW()
             """, (
                 schema["connection_id"],
                 schema["table_name"],
-                json.dumps(schema),
+                orjson.dumps(schema, default=str).decode(),
                 schema["schema_hash"],
-                schema.get("estimated_rows")
+                schema.get("estimated_rows"),
+                schema.get("fingerprint")
             ))
 
-            # Store foreign keys separately for fast lookup
-            if "foreign_keys" in schema:
-                for fk in schema["foreign_keys"]:
-                    cur.execute("""
-                        INSERT INTO foreign_keys
-                        (connection_id, from_table, from_columns, to_table, to_columns, source)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (connection_id, from_table, to_table) DO NOTHING
-                    """, (
-                        schema["connection_id"],
-                        schema["table_name"],
-                        fk["from_columns"],
-                        fk["to_table"],
-                        fk["to_columns"],
-                        "constraint"
-                    ))
-
-            self.conn.commit()
+            # Store foreign keys separately for fast lookup, in one statement
+            fk_rows = [
+                (
+                    schema["connection_id"],
+                    schema["table_name"],
+                    fk["from_columns"],
+                    fk["to_table"],
+                    fk["to_columns"],
+                    "constraint"
+                )
+                for fk in schema.get("foreign_keys", [])
+            ]
+            if fk_rows:
+                execute_values(cur, """
+                    INSERT INTO foreign_keys
+                    (connection_id, from_table, from_columns, to_table, to_columns, source)
+                    VALUES %s
+                    ON CONFLICT (connection_id, from_table, to_table) DO NOTHING
+                """, fk_rows, page_size=500)
+
+        self._invalidate_fk_cache(schema["connection_id"])
 
     def get_table_schema(self, connection_id, table_name):
         """Get cached schema for a table."""
-        with self.conn.cursor() as cur:
+        with self._connection() as conn, conn.cursor() as cur:
             cur.execute("""
-                SELECT schema_data, schema_hash
+                SELECT schema_data, schema_hash, fingerprint
                 FROM table_metadata
                 WHERE connection_id = %s AND table_name = %s
             """, (connection_id, table_name))
 
             row = cur.fetchone()
             if row:
-                return {"schema": row[0], "hash": row[1]}
+                return {"schema": row[0], "hash": row[1], "fingerprint": row[2]}
             return None
 
+    def get_table_hashes(self, connection_id):
+        """
+        Stored schema hash and fingerprint of every table of a connection,
+        in one query: {table_name: {"hash": ..., "fingerprint": ...}}.
+        """
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT table_name, schema_hash, fingerprint
+                FROM table_metadata
+                WHERE connection_id = %s
+            """, (connection_id,))
+            return {
+                table_name: {"hash": schema_hash, "fingerprint": fingerprint}
+                for table_name, schema_hash, fingerprint in cur.fetchall()
+            }
+
+    def get_table_counts(self):
+        """Number of stored tables per connection: {connection_id: count}."""
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT connection_id, COUNT(*)
+                FROM table_metadata
+                GROUP BY connection_id
+            """)
+            return dict(cur.fetchall())
+
+    def get_table_schemas_batch(self, pairs):
+        """
+        Cached schemas for many (connection_id, table_name) pairs in one query.
+        Returns {(connection_id, table_name): get_table_schema result}; pairs
+        without a stored schema are left out.
+        """
+        pairs = tuple(dict.fromkeys(tuple(pair) for pair in pairs))
+        if not pairs:
+            return {}
+
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT connection_id, table_name, schema_data, schema_hash, fingerprint
+                FROM table_metadata
+                WHERE (connection_id, table_name) IN %s
+            """, (pairs,))
+            return {
+                (row[0], row[1]): {"schema": row[2], "hash": row[3], "fingerprint": row[4]}
+                for row in cur.fetchall()
+            }
+
+    def update_table_fingerprint(self, connection_id, table_name, fingerprint):
+        """Record a new catalog fingerprint for a table whose schema hash is unchanged."""
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE table_metadata
+                SET fingerprint = %s
+                WHERE connection_id = %s AND table_name = %s
+            """, (fingerprint, connection_id, table_name))
+
     def get_fk_map(self, connection_id, table_names):
         """
         Get FK map for specific tables (FAST!).
         This is what Joinability Sheriff uses.
+        Results are cached in memory until the connection's FKs change.
         """
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT from_table, to_table, from_columns, to_columns, confidence, source
-                FROM foreign_keys
-                WHERE connection_id = %s
-                  AND from_table = ANY(%s)
-                  AND to_table = ANY(%s)
-            """, (connection_id, table_names, table_names))
+        key = (connection_id, frozenset(table_names))
+        with self._fk_cache_lock:
+            fk_map = self._fk_cache.get(key)
+            if fk_map is not None:
+                self._fk_cache.move_to_end(key)
+                return fk_map
 
-            fk_map = {}
-            for row in cur.fetchall():
-                from_table, to_table, from_cols, to_cols, confidence, source = row
+        fk_map = self._load_fk_map(connection_id, key[1])
+
+        with self._fk_cache_lock:
+            self._fk_cache[key] = fk_map
+            if len(self._fk_cache) > FK_CACHE_SIZE:
+                self._fk_cache.popitem(last=False)
+        return fk_map
 
-                if from_table not in fk_map:
-                    fk_map[from_table] = {}
+    def _load_fk_map(self, connection_id, table_names):
+        """Read the FK map for get_fk_map from fk_map_cache."""
+        with self._connection() as conn, conn.cursor() as cur:
+            self._execute_prepared(cur, "get_fk_map", (connection_id, list(table_names)))
 
-                fk_map[from_table][to_table] = {
-                    "from_columns": from_cols,
-                    "to_columns": to_cols,
-                    "confidence": confidence,
-                    "source": source
+            # Rows arrive grouped; keep only targets among the requested tables
+            fk_map = {}
+            for from_table, tos in cur.fetchall():
+                targets = {
+                    to_table: fk_info
+                    for to_table, fk_info in tos.items()
+                    if to_table in table_names
                 }
+                if targets:
+                    fk_map[from_table] = targets
 
             return fk_map
 
+    def _invalidate_fk_cache(self, connection_id):
+        """Drop cached FK maps of one connection."""
+        with self._fk_cache_lock:
+            for key in [key for key in self._fk_cache if key[0] == connection_id]:
+                del self._fk_cache[key]
+
+    def get_top_combinations(self, connection_id, table_scores, limit=30):
+        """
+        Enumerate table combinations along FK paths in one query.
+
+        Follows the FK map of fk_map_cache (what get_fk_map reads) from every
+        selected table, up to 3 tables, and returns what the Joinability
+        Sheriff builds in memory: singles in input order, then pairs, then
+        chains, each by average similarity score. Ties go by the input
+        positions of the tables, first table first (see generate_pairs).
+        Like the Sheriff, self-referencing FKs are followed; only chains that
+        end at the table they started from are left out.
+
+        Args:
+            connection_id: Connection the tables belong to
+            table_scores: {table_name: similarity_score}, in input order
+            limit: Max combinations returned
+
+        Returns:
+            [{"tables": [...], "similarity_score": float, "join_paths": [...]}, ...]
+        """
+        if not table_scores:
+            return []
+
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                WITH RECURSIVE scores AS (
+                    SELECT table_name, score, ord
+                    FROM unnest(%s::text[], %s::float8[]) WITH ORDINALITY
+                        AS s(table_name, score, ord)
+                ),
+                paths(tables, ords, score_sum, join_paths, depth) AS (
+                    SELECT ARRAY[s.table_name], ARRAY[s.ord], s.score, '[]'::jsonb, 1
+                    FROM scores s
+                    UNION ALL
+                    SELECT
+                        p.tables || fk.to_table,
+                        p.ords || s.ord,
+                        p.score_sum + s.score,
+                        p.join_paths || jsonb_build_array(jsonb_build_object(
+                            'from_table', p.tables[p.depth],
+                            'to_table', fk.to_table,
+                            'from_columns', fk.fk_info->'from_columns',
+                            'to_columns', fk.fk_info->'to_columns'
+                        )),
+                        p.depth + 1
+                    FROM paths p
+                    JOIN fk_map_cache f
+                      ON f.connection_id = %s
+                     AND f.from_table = p.tables[p.depth]
+                    CROSS JOIN LATERAL jsonb_each(f.tos) AS fk(to_table, fk_info)
+                    JOIN scores s ON s.table_name = fk.to_table
+                    WHERE p.depth < 3
+                      AND NOT (p.depth = 2 AND fk.to_table = p.tables[1])
+                )
+                SELECT tables, score_sum / depth AS similarity_score, join_paths
+                FROM paths
+                ORDER BY
+                    depth,
+                    CASE WHEN depth > 1 THEN score_sum / depth END DESC,
+                    ords
+                LIMIT %s
+            """, (
+                list(table_scores.keys()),
+                list(table_scores.values()),
+                connection_id,
+                limit
+            ))
+
+            return [
+                {
+                    "tables": tables,
+                    "similarity_score": similarity_score,
+                    "join_paths": join_paths
+                }
+                for tables, similarity_score, join_paths in cur.fetchall()
+            ]
+
+    def count_fk_tables(self, connection_id, table_names):
+        """
+        Number of tables among table_names with an FK to another of them
+        (len(get_fk_map(...)), without building the map).
+        """
+        table_names = list(table_names)
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*)
+                FROM fk_map_cache f
+                WHERE f.connection_id = %s
+                  AND f.from_table = ANY(%s)
+                  AND EXISTS (
+                      SELECT 1 FROM jsonb_object_keys(f.tos) AS to_table
+                      WHERE to_table = ANY(%s)
+                  )
+            """, (connection_id, table_names, table_names))
+            return cur.fetchone()[0]
+
     def update_connection_sync_time(self, connection_id):
         """Update last sync timestamp."""
-        with self.conn.cursor() as cur:
+        with self._connection() as conn, conn.cursor() as cur:
             cur.execute("""
                 UPDATE connections
                 SET last_synced = NOW()
                 WHERE connection_id = %s
             """, (connection_id,))
-            self.conn.commit()
\ No newline at end of file
+
+    def refresh_fk_map(self, connection_id):
+        """
+        Make FKs stored by store_table_schema visible to get_fk_map.
+        Call once after a batch of store_table_schema calls that changed
+        anything (the view is rebuilt for all connections).
+        """
+        with self._connection() as conn, conn.cursor() as cur:
+            # Readers aren't blocked while the view is rebuilt
+            cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY fk_map_cache")
+
+        self._invalidate_fk_cache(connection_id)
\ No newline at end of file
@@ -67,5 +67,11 @@ class QueryScoreModel(nn.Module):
         cls_embedding = outputs.last_hidden_state[:, 0, :]
 
         # Get score
-        score = self.regressor(cls_embedding)
+        if self.training:
+            score = self.regressor(cls_embedding)
+        else:
+            # Dropout is the identity in eval: call the two Linears directly
+            # (modules, not F.linear, so dynamically quantized layers still work)
+            hidden = torch.relu(self.regressor[0](cls_embedding))
+            score = torch.sigmoid(self.regressor[3](hidden))
         return score.squeeze(-1)  # Remove last dimension
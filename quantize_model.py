@@ -0,0 +1,131 @@
+"""
+Offline int8 (QDQ) quantization of the query score model for ONNX Runtime.
+
+Exports the trained model to ONNX and runs static quantization with a
+small calibration set, writing <model_path>.qdq.onnx next to the
+checkpoint. QueryScorePredictor(backend='onnx') picks that file up when
+present and falls back to the float32 export otherwise.
+
+Usage:
+    python quantize_model.py
+    python quantize_model.py --calibration_file prompts.jsonl
+
+Calibration file: one JSON object per line with "query", "schema" and
+"joins" keys, ideally real traffic.
+"""
+
+import os
+import json
+import argparse
+
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+
+from inference_api import QueryScorePredictor, DEFAULT_MODEL_PATH, DEFAULT_TOKENIZER_PATH
+
+# Used when no calibration file is given
+DEFAULT_CALIBRATION_SET = [
+    {
+        "query": "Find all employees in Sales department",
+        "schema": "Table: employees (employee_id, name, email, department_id, salary)\n"
+                  "Table: departments (department_id, department_name, location)",
+        "joins": "employees.department_id = departments.department_id"
+    },
+    {
+        "query": "Find all employees in Sales department",
+        "schema": "Table: employees (employee_id, name, email, salary)\n"
+                  "Table: departments (department_id, department_name, location)",
+        "joins": "(none)"
+    },
+    {
+        "query": "Show total order amount per customer",
+        "schema": "Table: orders (order_id, customer_id, amount, created_at)\n"
+                  "Table: customers (customer_id, name, country)",
+        "joins": "orders.customer_id = customers.customer_id"
+    },
+    {
+        "query": "List products that were never ordered",
+        "schema": "Table: products (product_id, name, price)\n"
+                  "Table: order_items (order_id, product_id, quantity)",
+        "joins": "order_items.product_id = products.product_id"
+    },
+    {
+        "query": "How many active accounts are there",
+        "schema": "Table: accounts (account_id, status, opened_at)",
+        "joins": "(none)"
+    },
+]
+
+
+class PromptCalibrationReader(CalibrationDataReader):
+    """
+    Feeds tokenized prompts to quantize_static, one at a time.
+    """
+
+    def __init__(self, predictor, examples):
+        self.inputs = iter([
+            predictor._encode([predictor.format_input(ex["query"], ex["schema"], ex["joins"])])
+            for ex in examples
+        ])
+
+    def get_next(self):
+        encoding = next(self.inputs, None)
+        if encoding is None:
+            return None
+        return {
+            'input_ids': encoding['input_ids'].numpy(),
+            'attention_mask': encoding['attention_mask'].numpy()
+        }
+
+
+def load_calibration_set(path):
+    """Read calibration prompts from a JSON lines file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def quantize(model_path, tokenizer_path, calibration_set):
+    """
+    Export and quantize the model.
+
+    Returns:
+        Path of the written .qdq.onnx file
+    """
+    predictor = QueryScorePredictor(model_path, tokenizer_path, compile=False, quantize=False)
+
+    base_path = os.path.splitext(model_path)[0]
+    fp32_path = base_path + '.onnx'
+    qdq_path = base_path + '.qdq.onnx'
+    if not os.path.exists(fp32_path):
+        predictor.export_onnx(fp32_path)
+
+    print(f"Calibrating on {len(calibration_set)} prompts...")
+    quantize_static(
+        fp32_path,
+        qdq_path,
+        calibration_data_reader=PromptCalibrationReader(predictor, calibration_set),
+        quant_format=QuantFormat.QDQ,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QInt8
+    )
+    print(f"✓ Quantized model written to {qdq_path}")
+    return qdq_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Quantize the query score model to int8 (QDQ)')
+    parser.add_argument('--model_path', default=DEFAULT_MODEL_PATH, help='Path to model file')
+    parser.add_argument('--tokenizer_path', default=DEFAULT_TOKENIZER_PATH, help='Path to tokenizer directory')
+    parser.add_argument('--calibration_file', help='JSON lines file of {"query", "schema", "joins"}')
+
+    args = parser.parse_args()
+
+    calibration_set = DEFAULT_CALIBRATION_SET
+    if args.calibration_file:
+        calibration_set = load_calibration_set(args.calibration_file)
+
+    quantize(args.model_path, args.tokenizer_path, calibration_set)
@@ -1,7 +1,219 @@
-from sqlalchemy import create_engine, inspect, MetaData
+from sqlalchemy import create_engine, inspect, text
 from pymongo import MongoClient
-import hashlib
-import json
+from pymongo.errors import PyMongoError
+from functools import lru_cache
+import logging
+import threading
+import xxhash
+
+logger = logging.getLogger(__name__)
+
+# Row estimates for every table of the current schema, read from planner
+# statistics in one query (no table scans). Rows are (table_name, estimated_rows).
+# Dialects missing here (e.g. SQLite) fall back to COUNT(*) per table.
+_ROW_ESTIMATE_SQL = {
+    "postgresql": """
+        SELECT c.relname, c.reltuples::bigint
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relkind IN ('r', 'p')
+    """,
+    "mysql": """
+        SELECT table_name, table_rows
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE()
+    """,
+    "mssql": """
+        SELECT t.name, SUM(p.row_count)
+        FROM sys.tables t
+        JOIN sys.dm_db_partition_stats p
+          ON p.object_id = t.object_id AND p.index_id IN (0, 1)
+        WHERE t.schema_id = SCHEMA_ID()
+        GROUP BY t.name
+    """,
+    "oracle": """
+        SELECT table_name, num_rows
+        FROM user_tables
+    """,
+}
+
+
+# Structural fingerprint of every table of the current schema in one query:
+# columns (name, type, nullability, default), constraints and indexes, but no
+# row statistics, so it only changes when the schema does. Rows are
+# (table_name, fingerprint). Dialects missing here always get fully inspected.
+_FINGERPRINT_SQL = {
+    "postgresql": """
+        SELECT c.relname, md5(concat_ws('|',
+            (SELECT string_agg(
+                        a.attname || ':' || format_type(a.atttypid, a.atttypmod)
+                        || ':' || a.attnotnull::text
+                        || ':' || coalesce(pg_get_expr(d.adbin, d.adrelid), ''),
+                        ',' ORDER BY a.attnum)
+             FROM pg_attribute a
+             LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+             WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped),
+            (SELECT string_agg(k.conname || ':' || pg_get_constraintdef(k.oid), ',' ORDER BY k.conname)
+             FROM pg_constraint k
+             WHERE k.conrelid = c.oid),
+            (SELECT string_agg(pg_get_indexdef(i.indexrelid), ',' ORDER BY i.indexrelid)
+             FROM pg_index i
+             WHERE i.indrelid = c.oid)
+        ))
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relkind IN ('r', 'p')
+    """,
+    # SUM(CRC32(...)) rather than GROUP_CONCAT, which truncates at group_concat_max_len
+    "mysql": """
+        SELECT cols.table_name, MD5(CONCAT_WS(':', cols.sig, IFNULL(keys_.sig, ''), IFNULL(idx.sig, '')))
+        FROM (
+            SELECT table_name, SUM(CRC32(CONCAT_WS(':', ordinal_position, column_name, column_type,
+                                                   is_nullable, IFNULL(column_default, '')))) AS sig
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE()
+            GROUP BY table_name
+        ) cols
+        LEFT JOIN (
+            SELECT table_name, SUM(CRC32(CONCAT_WS(':', constraint_name, column_name, ordinal_position,
+                                                   IFNULL(referenced_table_name, ''),
+                                                   IFNULL(referenced_column_name, '')))) AS sig
+            FROM information_schema.key_column_usage
+            WHERE table_schema = DATABASE()
+            GROUP BY table_name
+        ) keys_ ON keys_.table_name = cols.table_name
+        LEFT JOIN (
+            SELECT table_name, SUM(CRC32(CONCAT_WS(':', index_name, column_name, seq_in_index,
+                                                   non_unique))) AS sig
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+            GROUP BY table_name
+        ) idx ON idx.table_name = cols.table_name
+    """,
+}
+
+# Documents sampled per collection by get_mongodb_schema (conn_info "sample_size")
+DEFAULT_MONGO_SAMPLE_SIZE = 100
+
+# Upper bound for a collection's document count estimate
+MONGO_COUNT_TIMEOUT_MS = 500
+
+# BSON $type names -> the Python type names inferred from decoded documents
+_BSON_TYPE_NAMES = {
+    "double": "float",
+    "string": "str",
+    "object": "dict",
+    "array": "list",
+    "binData": "bytes",
+    "objectId": "ObjectId",
+    "bool": "bool",
+    "date": "datetime",
+    "null": "NoneType",
+    "regex": "Regex",
+    "javascript": "Code",
+    "int": "int",
+    "long": "int",
+    "timestamp": "Timestamp",
+    "decimal": "Decimal128",
+    "minKey": "MinKey",
+    "maxKey": "MaxKey",
+}
+
+
+@lru_cache(maxsize=64)
+def _engine_for(dsn):
+    """
+    Shared Engine per connection string.
+    Engines are thread-safe and own the connection pool, so every inspector
+    for the same database reuses warm connections; Connections themselves
+    are not thread-safe and are checked out per operation.
+    """
+    if dsn.startswith("sqlite"):
+        return create_engine(dsn)
+    # Room for the orchestrator's concurrent table workers
+    return create_engine(dsn, pool_size=16, max_overflow=8, pool_pre_ping=True)
+
+
+# Schema keys that change without the structure changing; left out of the hash
+_VOLATILE_KEYS = frozenset({"estimated_rows", "frequency", "schema_hash", "fingerprint"})
+
+
+# Top-level schema lists that are really sets: their catalog order is not a change
+_UNORDERED_KEYS = frozenset({"columns", "indexes", "foreign_keys", "fields"})
+
+
+def _canon(buf, value):
+    """
+    Append a canonical byte form of `value` to bytearray `buf`.
+    Dict keys are sorted; lists keep their order (column order inside a
+    key or index is structural). Every value is tagged (and strings
+    length-prefixed) to keep it unambiguous.
+    """
+    if isinstance(value, str):
+        data = value.encode()
+        buf += b"s%d:" % len(data)
+        buf += data
+    elif isinstance(value, dict):
+        buf += b"{"
+        for key in sorted(value):
+            if key in _VOLATILE_KEYS:
+                continue
+            _canon(buf, key)
+            buf += b"="
+            _canon(buf, value[key])
+        buf += b"}"
+    elif isinstance(value, (list, tuple)):
+        buf += b"["
+        for item in value:
+            _canon(buf, item)
+        buf += b"]"
+    elif isinstance(value, (set, frozenset)):
+        _canon_unordered(buf, value)
+    elif value is None:
+        buf += b"n"
+    else:
+        # bool/int/float (repr keeps True distinct from 1)
+        buf += b"v%s;" % repr(value).encode()
+
+
+def _canon_unordered(buf, items):
+    """
+    Append a collection whose order doesn't matter: items are ordered by
+    the xxh3_128 digest of their canonical bytes.
+    """
+    digests = []
+    for item in items:
+        item_buf = bytearray()
+        _canon(item_buf, item)
+        digests.append(xxhash.xxh3_128_digest(item_buf))
+    digests.sort()
+    buf += b"<"
+    buf += b"".join(digests)
+    buf += b">"
+
+
+def schema_signature(schema):
+    """
+    Fast structural hash of a table schema (xxh3, 16 hex chars).
+    Builds the canonical form of every key into one buffer and hashes it
+    once instead of serializing the whole dict; volatile values such as
+    estimated_rows are left out so row churn doesn't look like a change,
+    and the column/index/foreign key collections ignore catalog order.
+    """
+    buf = bytearray(b"{")
+    for key in sorted(schema):
+        if key in _VOLATILE_KEYS:
+            continue
+        _canon(buf, key)
+        buf += b"="
+        if key in _UNORDERED_KEYS and isinstance(schema[key], (list, tuple)):
+            _canon_unordered(buf, schema[key])
+        else:
+            _canon(buf, schema[key])
+    buf += b"}"
+    return xxhash.xxh3_64_hexdigest(buf)
 
 
 class UniversalSchemaInspector:
@@ -14,14 +226,21 @@ class UniversalSchemaInspector:
         self.conn_info = connection_info
         self.db_type = connection_info["type"]
         self.connection_id = connection_info["connection_id"]
+        # Columns/PKs/FKs/indexes of every table, see load_catalog()
+        self._catalog = None
+        self._catalog_lock = threading.Lock()
+        # table_name -> structural fingerprint, see load_fingerprints()
+        self._fingerprints = None
+        self._fingerprint_lock = threading.Lock()
 
     def connect(self):
         """Connect to database using appropriate driver."""
         if self.db_type in ["postgresql", "mysql", "mssql", "oracle", "sqlite"]:
             # Use SQLAlchemy for SQL databases
             conn_string = self.build_connection_string()
-            self.engine = create_engine(conn_string)
+            self.engine = _engine_for(conn_string)
             self.inspector = inspect(self.engine)
+            self._row_estimates = self.load_row_estimates()
 
         elif self.db_type == "mongodb":
             # Use pymongo for MongoDB
@@ -47,6 +266,126 @@ class UniversalSchemaInspector:
             return f"mssql+pyodbc://{user}:{pwd}@{host}:{port}/{db}"
         # ... other types
 
+    def load_row_estimates(self):
+        """
+        Fetch catalog row estimates for all tables in one query.
+
+        Returns:
+            {table_name: estimated_rows or None}, or None if the dialect
+            has no statistics query (see estimate_rows)
+        """
+        sql = _ROW_ESTIMATE_SQL.get(self.db_type)
+        if sql is None:
+            return None
+
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(text(sql)).fetchall()
+        except Exception as e:
+            logger.warning("Could not read row estimates for %s: %s", self.connection_id, e)
+            return None
+
+        dialect = self.engine.dialect
+        estimates = {}
+        for table_name, rows_estimate in rows:
+            if dialect.requires_name_normalize:
+                # Oracle reports upper-case names; match the inspector's lower-case ones
+                table_name = dialect.normalize_name(table_name)
+            # Postgres uses -1 for "never analyzed"
+            if rows_estimate is not None and rows_estimate >= 0:
+                estimates[table_name] = int(rows_estimate)
+            else:
+                estimates[table_name] = None
+        return estimates
+
+    def estimate_rows(self, table_name):
+        """Estimated row count of a table, or None if unknown."""
+        if self._row_estimates is not None:
+            return self._row_estimates.get(table_name)
+
+        # No statistics catalog for this dialect: count rows. Identifiers can't
+        # be bound, so quote the name with the dialect's own rules instead.
+        quoted = self.engine.dialect.identifier_preparer.quote(table_name)
+        try:
+            # Pooled engine (see _engine_for): no new TCP connection per table
+            with self.engine.connect() as conn:
+                return conn.execute(text(f"SELECT COUNT(*) FROM {quoted}")).scalar()
+        except Exception:
+            return None
+
+    def load_catalog(self):
+        """
+        Reflect columns, primary keys, foreign keys and indexes of all tables
+        at once (one query per catalog where the dialect supports it,
+        e.g. PostgreSQL and Oracle), instead of 4 queries per table.
+
+        Returns:
+            {"columns": {table_name: [...]}, "primary_key": {...},
+             "foreign_keys": {...}, "indexes": {...}}
+        """
+        with self._catalog_lock:
+            if self._catalog is None:
+                def by_table(multi):
+                    # get_multi_* results are keyed by (schema, table_name)
+                    return {key[1]: value for key, value in multi.items()}
+
+                self._catalog = {
+                    "columns": by_table(self.inspector.get_multi_columns()),
+                    "primary_key": by_table(self.inspector.get_multi_pk_constraint()),
+                    "foreign_keys": by_table(self.inspector.get_multi_foreign_keys()),
+                    "indexes": by_table(self.inspector.get_multi_indexes()),
+                }
+            return self._catalog
+
+    def get_table_catalog(self, table_name):
+        """
+        Columns, primary key, foreign keys and indexes of one table,
+        from the batched catalog when it has the table.
+        """
+        catalog = self.load_catalog()
+        if table_name in catalog["columns"]:
+            return (
+                catalog["columns"][table_name],
+                catalog["primary_key"].get(table_name),
+                catalog["foreign_keys"].get(table_name, []),
+                catalog["indexes"].get(table_name, [])
+            )
+
+        # Not in the snapshot (e.g. created since): ask for this table only
+        return (
+            self.inspector.get_columns(table_name),
+            self.inspector.get_pk_constraint(table_name),
+            self.inspector.get_foreign_keys(table_name),
+            self.inspector.get_indexes(table_name)
+        )
+
+    def load_fingerprints(self):
+        """
+        Fetch structural fingerprints of all tables in one query.
+
+        Returns:
+            {table_name: fingerprint}; empty if the database type has none
+        """
+        with self._fingerprint_lock:
+            if self._fingerprints is None:
+                self._fingerprints = {}
+                sql = _FINGERPRINT_SQL.get(self.db_type)
+                if sql is not None:
+                    try:
+                        with self.engine.connect() as conn:
+                            self._fingerprints = dict(conn.execute(text(sql)).fetchall())
+                    except Exception as e:
+                        logger.warning("Could not read fingerprints for %s: %s", self.connection_id, e)
+            return self._fingerprints
+
+    def get_cheap_fingerprint(self, table_name):
+        """
+        Catalog fingerprint of a table, changing whenever its columns,
+        constraints or indexes change, without building the full schema.
+        None if unavailable (then callers must inspect the table).
+        """
+        return self.load_fingerprints().get(table_name)
+
     def get_all_tables(self):
         """Get list of all tables/collections."""
         if self.db_type == "mongodb":
@@ -77,8 +416,10 @@ class UniversalSchemaInspector:
             "estimated_rows": 0
         }
 
+        columns, pk_constraint, foreign_keys, indexes = self.get_table_catalog(table_name)
+
         # Get columns
-        for col in self.inspector.get_columns(table_name):
+        for col in columns:
             schema["columns"].append({
                 "name": col["name"],
                 "type": str(col["type"]),
@@ -87,12 +428,11 @@ class UniversalSchemaInspector:
             })
 
         # Get primary key
-        pk_constraint = self.inspector.get_pk_constraint(table_name)
         if pk_constraint:
             schema["primary_key"] = pk_constraint["constrained_columns"]
 
         # Get foreign keys (CRITICAL!)
-        for fk in self.inspector.get_foreign_keys(table_name):
+        for fk in foreign_keys:
             schema["foreign_keys"].append({
                 "from_columns": fk["constrained_columns"],
                 "to_table": fk["referred_table"],
@@ -101,19 +441,15 @@ class UniversalSchemaInspector:
             })
 
         # Get indexes
-        for idx in self.inspector.get_indexes(table_name):
+        for idx in indexes:
             schema["indexes"].append({
                 "name": idx["name"],
                 "columns": idx["column_names"],
                 "unique": idx.get("unique", False)
             })
 
-        # Estimate row count
-        try:
-            result = self.engine.execute(f"SELECT COUNT(*) FROM {table_name}")
-            schema["estimated_rows"] = result.fetchone()[0]
-        except:
-            schema["estimated_rows"] = None
+        # Estimate row count (catalog statistics, no table scan)
+        schema["estimated_rows"] = self.estimate_rows(table_name)
 
         # Calculate schema hash (for change detection)
         schema["schema_hash"] = self.calculate_schema_hash(schema)
@@ -124,34 +460,48 @@ class UniversalSchemaInspector:
         """Get schema for MongoDB collection."""
         collection = self.db[collection_name]
 
-        # Sample documents to infer schema
-        sample = list(collection.find().limit(100))
-
         schema = {
             "connection_id": self.connection_id,
             "table_name": collection_name,
             "db_type": "mongodb",
             "fields": [],
             "indexes": [],
-            "estimated_rows": collection.estimated_document_count()
+            "estimated_rows": None
         }
 
-        # Infer fields from sample
+        # Infer fields server-side: sample documents, count (field, type) pairs.
+        # The sample is the first documents by _id (index walk), not $sample:
+        # a random sample would make optional fields and mixed types come and
+        # go between syncs, and change the schema hash without a real change.
+        sample_size = self.conn_info.get("sample_size", DEFAULT_MONGO_SAMPLE_SIZE)
+        pipeline = [
+            {"$sort": {"_id": 1}},
+            {"$limit": sample_size},
+            {"$project": {"kv": {"$objectToArray": "$$ROOT"}}},
+            {"$unwind": "$kv"},
+            {"$group": {"_id": {"k": "$kv.k", "t": {"$type": "$kv.v"}}, "n": {"$sum": 1}}},
+        ]
+
+        # Stream the (field, type) rows; one cursor batch covers typical collections
         field_stats = {}
-        for doc in sample:
-            for key, value in doc.items():
-                if key not in field_stats:
-                    field_stats[key] = {"types": set(), "count": 0}
+        for row in collection.aggregate(pipeline, batchSize=1000):
+            field_name = row["_id"]["k"]
+            bson_type = row["_id"]["t"]
+            if field_name not in field_stats:
+                field_stats[field_name] = {"types": set(), "count": 0}
 
-                field_stats[key]["types"].add(type(value).__name__)
-                field_stats[key]["count"] += 1
+            field_stats[field_name]["types"].add(_BSON_TYPE_NAMES.get(bson_type, bson_type))
+            field_stats[field_name]["count"] += row["n"]
 
-        # Convert to schema
-        for field_name, stats in field_stats.items():
+        # Every document has an _id, so its count is the sample size actually drawn
+        sampled = field_stats.get("_id", {}).get("count", 0)
+
+        # Convert to schema, most common fields first
+        for field_name, stats in sorted(field_stats.items(), key=lambda item: (-item[1]["count"], item[0])):
             schema["fields"].append({
                 "name": field_name,
-                "types": list(stats["types"]),
-                "frequency": stats["count"] / len(sample) if sample else 0
+                "types": sorted(stats["types"]),
+                "frequency": stats["count"] / sampled if sampled else 0
             })
 
         # Get indexes
@@ -161,14 +511,27 @@ class UniversalSchemaInspector:
                 "keys": list(idx["key"].keys())
             })
 
+        # Row estimate last, and bounded (see estimate_document_count)
+        schema["estimated_rows"] = self.estimate_document_count(collection)
+
         schema["schema_hash"] = self.calculate_schema_hash(schema)
 
         return schema
 
+    def estimate_document_count(self, collection):
+        """
+        Estimated document count, or None if disabled (skip_row_estimates)
+        or if the server doesn't answer within MONGO_COUNT_TIMEOUT_MS.
+        """
+        if self.conn_info.get("skip_row_estimates"):
+            return None
+        try:
+            return collection.estimated_document_count(maxTimeMS=MONGO_COUNT_TIMEOUT_MS)
+        except PyMongoError:
+            return None
+
     def calculate_schema_hash(self, schema):
         """
         Calculate hash of schema for change detection.
         """
-        # Create deterministic string representation
-        schema_str = json.dumps(schema, sort_keys=True, default=str)
-        return hashlib.md5(schema_str.encode()).hexdigest()
\ No newline at end of file
+        return schema_signature(schema)
\ No newline at end of file
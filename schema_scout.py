@@ -1,28 +1,93 @@
 from pymilvus import Collection, connections
+from collections import OrderedDict
+import logging
+import threading
+import numpy as np
+import time
+
+from schema_inspector import UniversalSchemaInspector
+
+# Celery is only needed when a resync task is passed to SchemaScout
+try:
+    from celery import group
+except ModuleNotFoundError as e:
+    if e.name != "celery":
+        raise
+    group = None
+
+logger = logging.getLogger(__name__)
+
+# Filtered (tenant) searches: candidate pool bounds and table-count refresh interval
+FILTERED_EF_FACTOR = 8
+FILTERED_EF_MAX = 4096
+TABLE_COUNT_TTL = 300
+
+# A table queued for resync isn't queued again within RESYNC_TTL seconds
+RESYNC_TTL = 60
+RESYNC_CACHE_SIZE = 4096
+
+
+def staircase_k_policy(elbow):
+    """Default k policy: round the elbow up to 5, 10 or 15 tables."""
+    if elbow <= 5:
+        return 5
+    elif elbow <= 10:
+        return 10
+    else:
+        return 15
+
+
+def raw_k_policy(elbow):
+    """Use the elbow itself as k."""
+    return elbow
+
 
 class SchemaScout:
     """
     Updated to work with Step 0's metadata system.
     """
 
-    def __init__(self, metadata_store, embedding_manager):
+    def __init__(self, metadata_store, embedding_manager, k_policy=staircase_k_policy,
+                 resync_task=None):
         self.metadata_store = metadata_store
         self.embedding_manager = embedding_manager
         self.collection = embedding_manager.collection
         self.embedding_model = embedding_manager.model
+        # Maps the score elbow to how many tables to return
+        self.k_policy = k_policy
+        # Celery task taking (connection_id, table_name), e.g.
+        # tasks.resync_table_embeddings; stale tables aren't resynced without it
+        if resync_task is not None and group is None:
+            raise RuntimeError("resync_task needs celery installed")
+        self._resync_task = resync_task
+        self._table_counts = None
+        self._table_counts_at = 0.0
+        self._recent_resyncs = OrderedDict()  # (connection_id, table_name) -> queued at
+        self._recent_resyncs_lock = threading.Lock()
 
-    def search_tables(self, question, connection_ids=None, top_k=2):
+    def search_tables(self, questions, connection_ids=None, top_k=2):
         """
         Search for relevant tables.
 
         Args:
-            question: User's natural language query
+            questions: User's natural language query, or a list of queries
+                searched together in one Milvus request
             connection_ids: Optional filter for specific connections (tenant isolation)
             top_k: How many tables to return
+
+        Returns one result dict for a single question, or a list of them
+        (in input order) for a list of questions.
         """
+        single = isinstance(questions, str)
+        if single:
+            questions = [questions]
 
-        # Step 1: Embed the question
-        question_embedding = self.embedding_model.encode(question).tolist()
+        # Step 1: Embed the questions in one batched call
+        # (unit-length float32, like the stored table embeddings; no per-element
+        # Python floats to build and serialize)
+        question_embeddings = self.embedding_model.encode(
+            questions, batch_size=32, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
 
         # Step 2: Build Milvus filter expression
         filter_expr = None
@@ -31,149 +96,209 @@ class SchemaScout:
             conn_list = ", ".join([f'"{c}"' for c in connection_ids])
             filter_expr = f"connection_id in [{conn_list}]"
 
-        # Step 3: Vector search in Milvus
-        search_params = {"metric_type": "COSINE", "params": {"nprobe": 10}}
-
+        # Step 3: Vector search in Milvus (HNSW; ef must be >= limit)
         results = self.collection.search(
-            data=[question_embedding],
+            data=list(question_embeddings),
             anns_field="embedding",
-            param=search_params,
+            param=self._search_params(connection_ids, top_k),
             limit=top_k,
             expr=filter_expr,
             output_fields=["connection_id", "table_name", "schema_hash"]
         )
 
+        # Current schemas of every hit (all questions) in one metadata query
+        cached_schemas = self.metadata_store.get_table_schemas_batch(
+            (hit.entity.get("connection_id"), hit.entity.get("table_name"))
+            for hits in results for hit in hits
+        )
+
+        # Steps 4-5: Validate hits and pick k per question
+        tables_to_resync = {}
+        answers = [self._validate_hits(hits, cached_schemas, tables_to_resync) for hits in results]
+
+        # Step 6: Trigger async resync for stale embeddings (once per table)
+        if tables_to_resync:
+            self.trigger_async_resync(list(tables_to_resync.values()))
+
+        return answers[0] if single else answers
+
+    def _search_params(self, connection_ids, top_k):
+        """
+        Search param for collection.search. Tenant-filtered searches widen ef
+        (and ask Milvus to keep scanning past filtered-out candidates) so they
+        still return top_k tables; the more selective the filter, the wider ef.
+        """
+        if not connection_ids:
+            return {"metric_type": "COSINE", "params": {"ef": max(64, top_k)}}
+
+        ef = max(64, top_k * FILTERED_EF_FACTOR)
+        counts = self._get_table_counts()
+        total = sum(counts.values())
+        selected = sum(counts.get(c, 0) for c in connection_ids)
+        if selected and total:
+            # Expect ef * selected / total candidates to survive the filter
+            ef = max(ef, top_k * total // selected)
+        # hints is read from the top level of the search param, not from params
+        return {
+            "metric_type": "COSINE",
+            "params": {"ef": min(ef, FILTERED_EF_MAX)},
+            "hints": "iterative_filter"
+        }
+
+    def _get_table_counts(self):
+        """Per-connection table counts, refreshed every TABLE_COUNT_TTL seconds."""
+        now = time.monotonic()
+        if self._table_counts is None or now - self._table_counts_at > TABLE_COUNT_TTL:
+            self._table_counts = self.metadata_store.get_table_counts()
+            self._table_counts_at = now
+        return self._table_counts
+
+    def _validate_hits(self, hits, cached_schemas, tables_to_resync):
+        """
+        Drop hits whose embedding is stale and pick k for one question.
+        cached_schemas is the get_table_schemas_batch result for the hits.
+        Stale tables are collected into tables_to_resync.
+        """
         # Step 4: Check if embeddings are stale
         validated_results = []
-        tables_to_resync = []
+        stale = 0
 
-        for hit in results[0]:
-            # Get current schema from metadata store
-            cached_schema = self.metadata_store.get_table_schema(
-                hit.entity.get("connection_id"),
-                hit.entity.get("table_name")
-            )
+        for hit in hits:
+            connection_id = hit.entity.get("connection_id")
+            table_name = hit.entity.get("table_name")
 
-            if cached_schema:
-                # Check if schema hash matches
-                if cached_schema["hash"] == hit.entity.get("schema_hash"):
-                    # Embedding is up-to-date
-                    validated_results.append({
-                        "connection_id": hit.entity.get("connection_id"),
-                        "table_name": hit.entity.get("table_name"),
-                        "similarity_score": hit.distance,
-                        "schema": cached_schema["schema"]
-                    })
-                else:
-                    # Schema changed but embedding not updated
-                    # Trigger async resync
-                    tables_to_resync.append({
-                        "connection_id": hit.entity.get("connection_id"),
-                        "table_name": hit.entity.get("table_name")
-                    })
-            else:
-                # Schema not in cache (shouldn't happen, but handle it)
-                tables_to_resync.append({
-                    "connection_id": hit.entity.get("connection_id"),
-                    "table_name": hit.entity.get("table_name")
-                })
+            # Current schema from the metadata store
+            cached_schema = cached_schemas.get((connection_id, table_name))
 
-        # Step 5: Trigger async resync for stale embeddings
-        if tables_to_resync:
-            self.trigger_async_resync(tables_to_resync)
+            # Check if schema hash matches
+            if cached_schema and cached_schema["hash"] == hit.entity.get("schema_hash"):
+                # Embedding is up-to-date
+                validated_results.append({
+                    "connection_id": connection_id,
+                    "table_name": table_name,
+                    "similarity_score": hit.distance,
+                    "schema": cached_schema["schema"]
+                })
+            else:
+                # Schema changed but embedding not updated, or schema not
+                # in cache (shouldn't happen, but handle it)
+                stale += 1
+                tables_to_resync[(connection_id, table_name)] = {
+                    "connection_id": connection_id,
+                    "table_name": table_name
+                }
 
-        # Step 6: Apply elbow detection for dynamic k selection
+        # Step 5: Apply elbow detection for dynamic k selection
         if len(validated_results) == 0:
             return {"tables": [], "k": 0}
 
         scores = [t["similarity_score"] for t in validated_results]
-        k = self.find_score_elbow(scores)
-
-        # Apply bounds (5-15)
-        k = max(5, min(15, k))
+        k = self.k_policy(self.find_score_elbow(scores))
 
         return {
             "tables": validated_results[:k],
             "k": k,
-            "total_searched": len(results[0]),
-            "stale_embeddings": len(tables_to_resync)
+            "total_searched": len(hits),
+            "stale_embeddings": stale
         }
 
     def find_score_elbow(self, scores):
         """
-        Find where scores drop sharply.
-        (Same logic as before)
+        Find where scores drop sharply: the number of results before the
+        largest drop between consecutive scores.
         """
-        if len(scores) < 3:
-            return len(scores)
-
-        drops = []
-        for i in range(len(scores) - 1):
-            drop = scores[i] - scores[i + 1]
-            drops.append(drop)
-
-        max_drop_idx = drops.index(max(drops))
-        elbow_point = max_drop_idx + 1
-
-        if elbow_point <= 5:
-            return 5
-        elif elbow_point <= 10:
-            return 10
-        else:
-            return 15
+        s = np.asarray(scores, dtype=np.float32)
+        if s.size < 3:
+            return int(s.size)
+        return int(np.argmax(s[:-1] - s[1:])) + 1
 
     def trigger_async_resync(self, tables):
         """
         Trigger background job to resync stale embeddings.
         """
-        # Queue async job (using Celery, RQ, or similar)
-        from tasks import resync_table_embeddings
-        for table in tables:
-            resync_table_embeddings.delay(
-                table["connection_id"],
-                table["table_name"]
+        if self._resync_task is None:
+            logger.warning(
+                "No resync_task configured; %d stale tables not queued", len(tables)
             )
+            return
+
+        # Dedupe, and drop tables already queued in the last RESYNC_TTL seconds
+        now = time.monotonic()
+        keys = []
+        with self._recent_resyncs_lock:
+            for key in dict.fromkeys((t["connection_id"], t["table_name"]) for t in tables):
+                queued_at = self._recent_resyncs.get(key)
+                if queued_at is not None and now - queued_at < RESYNC_TTL:
+                    continue
+                self._recent_resyncs[key] = now
+                self._recent_resyncs.move_to_end(key)
+                keys.append(key)
+            while len(self._recent_resyncs) > RESYNC_CACHE_SIZE:
+                self._recent_resyncs.popitem(last=False)
+
+        if not keys:
+            return
 
-    def ensure_embeddings_exist(self, connection_id, table_names):
+        # Queue async jobs (Celery) in one group: one broker round-trip
+        try:
+            group(self._resync_task.s(cid, table) for cid, table in keys).apply_async()
+        except Exception:
+            # Nothing was queued: don't suppress these tables for RESYNC_TTL
+            with self._recent_resyncs_lock:
+                for key in keys:
+                    if self._recent_resyncs.get(key) == now:
+                        del self._recent_resyncs[key]
+            raise
+
+    def ensure_embeddings_exist(self, connection_info, table_names):
         """
         Check if embeddings exist for tables.
         Generate if missing (synchronous, for critical tables).
-        """
-        missing = []
-
-        for table_name in table_names:
-            # Check Milvus
-            expr = f'connection_id == "{connection_id}" and table_name == "{table_name}"'
-            results = self.collection.query(expr=expr, output_fields=["table_name"])
 
-            if not results:
-                missing.append(table_name)
+        Args:
+            connection_info: Connection dict as passed to sync_connection
+                (credentials aren't kept in the metadata store)
+            table_names: Tables that must have an embedding
 
-        if missing:
-            # Generate embeddings synchronously
-            from schema_inspector import UniversalSchemaInspector
-            from sync_orchestrator import SchemaSyncOrchestrator
+        Returns the tables that were missing.
+        """
+        connection_id = connection_info["connection_id"]
 
-            # Get connection info
-            conn_info = self.metadata_store.get_connection_info(connection_id)
+        # Check Milvus (one batched query instead of one per table)
+        present = self.embedding_manager.existing_tables(connection_id, table_names)
+        missing = [t for t in table_names if t not in present]
 
+        if missing:
             # Sync missing tables
-            inspector = UniversalSchemaInspector(conn_info)
+            inspector = UniversalSchemaInspector(connection_info)
             inspector.connect()
 
+            schemas = []
             for table_name in missing:
                 try:
                     schema = inspector.get_table_schema(table_name)
-                    self.metadata_store.store_table_schema(schema)
-
-                    embedding = self.embedding_manager.generate_embedding(schema)
-                    self.embedding_manager.store_embedding(
-                        connection_id,
-                        table_name,
-                        schema["schema_hash"],
-                        embedding
-                    )
+                    self.metadata_store.store_table_schema(schema, connection_info)
+                    schemas.append(schema)
                 except Exception as e:
-                    print(f"Failed to generate embedding for {table_name}: {e}")
+                    logger.warning("Failed to generate embedding for %s: %s", table_name, e)
+
+            if schemas:
+                # Generate embeddings synchronously, in one batched encode
+                embeddings, schema_texts = self.embedding_manager.generate_embeddings_cached(schemas)
+                self.embedding_manager.store_embeddings_bulk([
+                    {
+                        "connection_id": connection_id,
+                        "table_name": schema["table_name"],
+                        "schema_hash": schema["schema_hash"],
+                        "schema_text": schema_text,
+                        "embedding": embedding,
+                        "metadata": self.embedding_manager.embedding_metadata(schema)
+                    }
+                    for schema, embedding, schema_text in zip(schemas, embeddings, schema_texts)
+                ])
+                self.embedding_manager.flush()
+
+                # FKs of the new schemas, for get_fk_map
+                self.metadata_store.refresh_fk_map(connection_id)
 
-        return missing
\ No newline at end of file
+        return missing
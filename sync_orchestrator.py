@@ -1,6 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
 from schema_inspector import UniversalSchemaInspector
 import json
 
+# Tables inspected/stored concurrently per connection; keep <= the engine pool size
+SYNC_TABLE_WORKERS = 16
+
+logger = logging.getLogger(__name__)
+
 
 class SchemaSyncOrchestrator:
     """
@@ -15,7 +23,7 @@ class SchemaSyncOrchestrator:
         """
         Sync one database connection.
         """
-        print(f"Syncing {connection_info['connection_id']}...")
+        logger.info("Syncing %s...", connection_info["connection_id"])
 
         # Connect to database
         inspector = UniversalSchemaInspector(connection_info)
@@ -23,75 +31,126 @@ class SchemaSyncOrchestrator:
 
         # Get all tables
         tables = inspector.get_all_tables()
-        print(f"Found {len(tables)} tables")
+        logger.info("Found %d tables", len(tables))
+
+        # Stored hashes/fingerprints of all tables, instead of one lookup per table
+        known = self.metadata_store.get_table_hashes(connection_info["connection_id"])
 
-        synced_count = 0
         skipped_count = 0
+        changed = []  # Schemas that differ from the stored ones
 
-        for table_name in tables:
-            try:
-                # Get schema
-                schema = inspector.get_table_schema(table_name)
-                print('1')
-                # Check if schema changed
-                cached = self.metadata_store.get_table_schema(
-                    connection_info["connection_id"],
-                    table_name
-                )
-                print('2')
-                if cached and cached["hash"] == schema["schema_hash"]:
-                    # Schema unchanged, skip
+        # Inspect and compare tables concurrently (each step is I/O-bound)
+        with ThreadPoolExecutor(max_workers=SYNC_TABLE_WORKERS) as executor:
+            outcomes = executor.map(
+                lambda table_name: self._sync_table(
+                    inspector, connection_info, table_name, known.get(table_name)
+                ),
+                tables
+            )
+            for outcome, schema in outcomes:
+                if outcome == "skipped":
                     skipped_count += 1
-                    continue
-                print('3')
-                # Store metadata
-                self.metadata_store.store_table_schema(schema, connection_info)
-                print('4')
-                # Check if embedding exists and is up-to-date
-                exists, existing_embedding = self.embedding_manager.embedding_exists(
-                    schema["connection_id"],
-                    schema["table_name"],
-                    schema["schema_hash"]
-                )
-                print('5')
-                if not exists:
-                    # Generate new embedding
-                    print('6')
-                    embedding = self.embedding_manager.generate_embedding(schema)
-                    print('7')
-                    # Build schema text description
-                    schema_text = self.embedding_manager.build_table_description(schema)
-                    print('8')
-                    # Build metadata
-                    metadata = {
-                        "connection_id": schema["connection_id"],
-                        "table_name": schema["table_name"],
-                        "db_type": schema["db_type"],
-                        "column_count": len(schema.get("columns", [])),
-                        "has_foreign_keys": len(schema.get("foreign_keys", [])) > 0,
-                        "estimated_rows": schema.get("estimated_rows")
-                    }
-                    print('9')
-                    # Store in Milvus
-                    self.embedding_manager.store_embedding(
-                        schema["connection_id"],
-                        schema["table_name"],
-                        schema["schema_hash"],
-                        embedding,
-                        schema_text,
-                        metadata
-                    )
-                    print('10')
-                synced_count += 1
+                elif outcome == "changed":
+                    changed.append(schema)
+
+        # Embed first: metadata is only stored once its embedding is in Milvus,
+        # so a failure here leaves the tables "changed" for the next sync
+        # (the exception propagates and the sync time isn't updated)
+        self._embed_schemas(changed)
 
-            except Exception as e:
-                print(f"Failed to sync {table_name}: {e}")
+        # Store metadata of the embedded tables
+        with ThreadPoolExecutor(max_workers=SYNC_TABLE_WORKERS) as executor:
+            stored = executor.map(
+                lambda schema: self._store_schema(connection_info, schema),
+                changed
+            )
+            synced_count = sum(stored)
+
+        # Make the new FKs visible to the Joinability Sheriff (only if any changed)
+        if changed:
+            self.metadata_store.refresh_fk_map(connection_info["connection_id"])
 
         # Update sync timestamp
         self.metadata_store.update_connection_sync_time(connection_info["connection_id"])
 
-        print(f"Synced: {synced_count}, Skipped: {skipped_count}")
-
+        logger.info("Synced: %d, Skipped: %d", synced_count, skipped_count)
 
         return {"synced": synced_count, "skipped": skipped_count}
 
+    def _sync_table(self, inspector, connection_info, table_name, cached):
+        """
+        Inspect one table and compare it with the stored schema.
+        `cached` is the table's get_table_hashes entry (None if new).
+
+        Returns:
+            ("skipped", None), ("changed", schema) or ("failed", None)
+        """
+        try:
+            # Same catalog fingerprint: schema unchanged, skip without inspecting
+            fingerprint = inspector.get_cheap_fingerprint(table_name)
+            if fingerprint and cached and cached["fingerprint"] == fingerprint:
+                return "skipped", None
+
+            # Get schema
+            schema = inspector.get_table_schema(table_name)
+            schema["fingerprint"] = fingerprint
+            # Check if schema changed
+            if cached and cached["hash"] == schema["schema_hash"]:
+                # Schema unchanged, skip (remember the fingerprint for next time)
+                if fingerprint:
+                    self.metadata_store.update_table_fingerprint(
+                        connection_info["connection_id"], table_name, fingerprint
+                    )
+                return "skipped", None
+            # Stored by sync_connection once the embedding is in place
+            return "changed", schema
+
+        except Exception as e:
+            logger.warning("Failed to sync %s: %s", table_name, e)
+            return "failed", None
+
+    def _embed_schemas(self, schemas):
+        """
+        Make sure every schema has an up-to-date embedding in Milvus.
+        Raises if generating or storing them fails.
+        """
+        if not schemas:
+            return
+
+        # Check which embeddings exist and are up-to-date (one query)
+        fresh = self.embedding_manager.up_to_date_tables(
+            schemas[0]["connection_id"],
+            [schema["table_name"] for schema in schemas],
+            [schema["schema_hash"] for schema in schemas]
+        )
+        pending = [schema for schema in schemas if schema["table_name"] not in fresh]
+        if not pending:
+            return
+
+        # Generate all new embeddings in one batched encode (reusing cached ones)
+        embeddings, schema_texts = self.embedding_manager.generate_embeddings_cached(pending)
+
+        # Store all rows in Milvus in one column-format upsert
+        self.embedding_manager.store_embeddings_bulk([
+            {
+                "connection_id": schema["connection_id"],
+                "table_name": schema["table_name"],
+                "schema_hash": schema["schema_hash"],
+                "schema_text": schema_text,
+                "embedding": embedding,  # float32 row, no list conversion
+                "metadata": self.embedding_manager.embedding_metadata(schema)
+            }
+            for schema, embedding, schema_text in zip(pending, embeddings, schema_texts)
+        ])
+
+        # One segment seal for the whole connection
+        self.embedding_manager.flush()
+
+    def _store_schema(self, connection_info, schema):
+        """Store one table's metadata; returns whether it was stored."""
+        try:
+            self.metadata_store.store_table_schema(schema, connection_info)
+            return True
+        except Exception as e:
+            logger.warning("Failed to store %s: %s", schema["table_name"], e)
+            return False
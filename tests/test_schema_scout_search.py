@@ -0,0 +1,90 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pymilvus")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pymongo")
+pytest.importorskip("xxhash")
+
+from schema_scout import SchemaScout
+
+
+class RecordingCollection:
+    """Records collection.search calls and returns no hits."""
+
+    def __init__(self):
+        self.calls = []
+
+    def search(self, data, **kwargs):
+        self.calls.append(kwargs)
+        return [[] for _ in data]
+
+
+class EncodeModel:
+    def encode(self, questions, **kwargs):
+        return np.ones((len(questions), 4), dtype=np.float32)
+
+
+class EmbeddingManager:
+    def __init__(self):
+        self.collection = RecordingCollection()
+        self.model = EncodeModel()
+
+
+class MetadataStore:
+    def get_table_counts(self):
+        return {"c1": 10, "c2": 990}
+
+    def get_table_schemas_batch(self, pairs):
+        list(pairs)
+        return {}
+
+
+def search_param(**kwargs):
+    manager = EmbeddingManager()
+    scout = SchemaScout(MetadataStore(), manager)
+    scout.search_tables("active accounts", **kwargs)
+    (call,) = manager.collection.calls
+    return call["param"]
+
+
+def test_unfiltered_search_param():
+    assert search_param(top_k=5) == {"metric_type": "COSINE", "params": {"ef": 64}}
+
+
+def test_filtered_search_puts_hints_at_top_level():
+    param = search_param(connection_ids=["c1"], top_k=5)
+    assert param["metric_type"] == "COSINE"
+    assert param["hints"] == "iterative_filter"
+    assert "hints" not in param["params"]
+    # 1% selectivity: ef grows to top_k / selectivity
+    assert param["params"] == {"ef": 500}
+
+
+class FailingGroup:
+    def __init__(self, signatures):
+        self.signatures = list(signatures)
+
+    def apply_async(self):
+        raise ConnectionError("broker down")
+
+
+class ResyncTask:
+    def s(self, connection_id, table_name):
+        return (connection_id, table_name)
+
+
+def test_failed_resync_is_not_suppressed(monkeypatch):
+    import schema_scout
+
+    monkeypatch.setattr(schema_scout, "group", FailingGroup)
+    scout = SchemaScout(MetadataStore(), EmbeddingManager(), resync_task=ResyncTask())
+    tables = [{"connection_id": "c1", "table_name": "orders"}]
+
+    with pytest.raises(ConnectionError):
+        scout.trigger_async_resync(tables)
+
+    # Nothing reached the broker, so the next call must try again
+    assert ("c1", "orders") not in scout._recent_resyncs
+    with pytest.raises(ConnectionError):
+        scout.trigger_async_resync(tables)
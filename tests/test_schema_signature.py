@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("xxhash")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pymongo")
+
+from schema_inspector import schema_signature
+
+
+def make_schema(**overrides):
+    schema = {
+        "connection_id": "c1",
+        "table_name": "order_lines",
+        "db_type": "postgresql",
+        "columns": [
+            {"name": "order_id", "type": "INTEGER", "nullable": False, "default": None},
+            {"name": "line_no", "type": "INTEGER", "nullable": False, "default": None},
+            {"name": "sku", "type": "VARCHAR(20)", "nullable": True, "default": None},
+        ],
+        "primary_key": ["order_id", "line_no"],
+        "foreign_keys": [
+            {"from_columns": ["order_id", "line_no"], "to_table": "shipments",
+             "to_columns": ["order_id", "line_no"], "name": "fk_ship"},
+        ],
+        "indexes": [
+            {"name": "ix_sku", "columns": ["sku", "order_id"], "unique": False},
+        ],
+        "estimated_rows": 10,
+    }
+    schema.update(overrides)
+    return schema
+
+
+def test_catalog_order_of_columns_does_not_change_signature():
+    schema = make_schema()
+    reordered = make_schema(columns=list(reversed(schema["columns"])))
+    assert schema_signature(schema) == schema_signature(reordered)
+
+
+def test_row_estimate_does_not_change_signature():
+    assert schema_signature(make_schema()) == schema_signature(make_schema(estimated_rows=99))
+
+
+def test_composite_fk_column_swap_changes_signature():
+    swapped = make_schema(foreign_keys=[
+        {"from_columns": ["order_id", "line_no"], "to_table": "shipments",
+         "to_columns": ["line_no", "order_id"], "name": "fk_ship"},
+    ])
+    assert schema_signature(make_schema()) != schema_signature(swapped)
+
+
+def test_composite_pk_reorder_changes_signature():
+    reordered = make_schema(primary_key=["line_no", "order_id"])
+    assert schema_signature(make_schema()) != schema_signature(reordered)
+
+
+def test_index_column_reorder_changes_signature():
+    reordered = make_schema(indexes=[
+        {"name": "ix_sku", "columns": ["order_id", "sku"], "unique": False},
+    ])
+    assert schema_signature(make_schema()) != schema_signature(reordered)
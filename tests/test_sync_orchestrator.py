@@ -0,0 +1,111 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pymongo")
+pytest.importorskip("xxhash")
+
+import sync_orchestrator
+from sync_orchestrator import SchemaSyncOrchestrator
+
+CONNECTION = {"connection_id": "c1", "type": "postgresql"}
+
+
+class Inspector:
+    def __init__(self, connection_info):
+        pass
+
+    def connect(self):
+        pass
+
+    def get_all_tables(self):
+        return ["orders", "customers"]
+
+    def get_cheap_fingerprint(self, table_name):
+        return f"fp-{table_name}"
+
+    def get_table_schema(self, table_name):
+        return {"connection_id": "c1", "table_name": table_name,
+                "db_type": "postgresql", "schema_hash": f"h-{table_name}"}
+
+
+class MetadataStore:
+    def __init__(self):
+        self.stored = []
+        self.sync_times = []
+        self.refreshes = 0
+
+    def get_table_hashes(self, connection_id):
+        return {}
+
+    def store_table_schema(self, schema, connection_info):
+        self.stored.append(schema["table_name"])
+
+    def update_connection_sync_time(self, connection_id):
+        self.sync_times.append(connection_id)
+
+    def refresh_fk_map(self, connection_id):
+        self.refreshes += 1
+
+
+class EmbeddingManager:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.upserted = []
+
+    def up_to_date_tables(self, connection_id, table_names, schema_hashes):
+        return set()
+
+    def generate_embeddings_cached(self, schemas):
+        if self.fail:
+            raise RuntimeError("encoder down")
+        return [[0.0]] * len(schemas), ["text"] * len(schemas)
+
+    def embedding_metadata(self, schema):
+        return {}
+
+    def store_embeddings_bulk(self, rows):
+        self.upserted.extend(row["table_name"] for row in rows)
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_inspector(monkeypatch):
+    monkeypatch.setattr(sync_orchestrator, "UniversalSchemaInspector", Inspector)
+
+
+def test_metadata_is_stored_after_embeddings():
+    store, manager = MetadataStore(), EmbeddingManager()
+    result = SchemaSyncOrchestrator(store, manager).sync_connection(CONNECTION)
+
+    assert result == {"synced": 2, "skipped": 0}
+    assert sorted(manager.upserted) == ["customers", "orders"]
+    assert sorted(store.stored) == ["customers", "orders"]
+    assert store.sync_times == ["c1"]
+    assert store.refreshes == 1
+
+
+def test_embedding_failure_leaves_tables_unstored_for_next_sync():
+    store, manager = MetadataStore(), EmbeddingManager(fail=True)
+
+    with pytest.raises(RuntimeError):
+        SchemaSyncOrchestrator(store, manager).sync_connection(CONNECTION)
+
+    assert store.stored == []
+    assert store.sync_times == []
+    assert store.refreshes == 0
+
+
+def test_unchanged_sync_does_not_refresh_fk_map(monkeypatch):
+    store, manager = MetadataStore(), EmbeddingManager()
+    monkeypatch.setattr(store, "get_table_hashes", lambda connection_id: {
+        name: {"hash": f"h-{name}", "fingerprint": f"fp-{name}"}
+        for name in ("orders", "customers")
+    })
+
+    result = SchemaSyncOrchestrator(store, manager).sync_connection(CONNECTION)
+
+    assert result == {"synced": 0, "skipped": 2}
+    assert store.refreshes == 0
+    assert store.sync_times == ["c1"]
@@ -0,0 +1,85 @@
+"""
+Parity between the Joinability Sheriff's NumPy path and the recursive CTE
+in MetadataStore.get_top_combinations. Needs a scratch PostgreSQL database:
+set METADATA_TEST_DSN (e.g. postgresql://postgres@localhost/metadata_test).
+"""
+import itertools
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("psycopg2")
+pytest.importorskip("orjson")
+
+from joinability_sheriff import JoinabilitySheriff
+from metadata_store import MetadataStore
+
+DSN = os.getenv("METADATA_TEST_DSN")
+pytestmark = pytest.mark.skipif(not DSN, reason="METADATA_TEST_DSN not set")
+
+# Few distinct scores, so pairs and chains tie at the 30-combination cutoff
+SCORES = {"a": 0.9, "b": 0.7, "c": 0.9, "d": 0.5, "e": 0.7, "f": 0.9}
+
+
+@pytest.fixture
+def store():
+    store = MetadataStore({"dsn": DSN}, {"minconn": 1, "maxconn": 2})
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def connection_id(store):
+    connection_id = f"parity-{uuid.uuid4().hex}"
+    yield connection_id
+    with store._connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM foreign_keys WHERE connection_id = %s", (connection_id,))
+    store.refresh_fk_map(connection_id)
+
+
+def store_fks(store, connection_id, edges):
+    with store._connection() as conn, conn.cursor() as cur:
+        for from_table, to_table in edges:
+            cur.execute("""
+                INSERT INTO foreign_keys
+                (connection_id, from_table, from_columns, to_table, to_columns, source)
+                VALUES (%s, %s, %s, %s, %s, 'test')
+            """, (connection_id, from_table, [f"{to_table}_id"], to_table, ["id"]))
+    store.refresh_fk_map(connection_id)
+
+
+def selected(connection_id, scores):
+    return [
+        {"connection_id": connection_id, "table_name": name, "similarity_score": score}
+        for name, score in scores.items()
+    ]
+
+
+def generate(store, connection_id, scores, use_sql):
+    sheriff = JoinabilitySheriff(store, use_sql=use_sql)
+    return sheriff.generate_combinations(selected(connection_id, scores))
+
+
+def test_sql_path_matches_numpy_path_with_ties_and_self_fks(store, connection_id):
+    # Dense graph: every ordered pair, plus self-referencing FKs on a and d
+    edges = list(itertools.permutations(SCORES, 2)) + [("a", "a"), ("d", "d")]
+    store_fks(store, connection_id, edges)
+
+    expected = generate(store, connection_id, SCORES, use_sql=False)
+    actual = generate(store, connection_id, SCORES, use_sql=True)
+
+    assert len(expected["combinations"]) == 30
+    assert actual == expected
+
+
+def test_sql_path_matches_numpy_path_on_sparse_graph(store, connection_id):
+    edges = [("a", "b"), ("b", "c"), ("c", "a"), ("b", "b"), ("e", "f")]
+    store_fks(store, connection_id, edges)
+
+    expected = generate(store, connection_id, SCORES, use_sql=False)
+    actual = generate(store, connection_id, SCORES, use_sql=True)
+
+    # Same combinations and the same metadata (incl. fk_relationships_found)
+    assert actual == expected